@@ -1,18 +1,36 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 import jwt
 import os
 from functools import wraps
 from dotenv import load_dotenv
-from config import SECRET_KEY, get_db_connection
-from flask_caching import Cache
+from config import get_db_connection, get_pool_stats
+from tokens import decode_token, token_cache
+from images import VARIANTS_FOLDER, load_manifest, pick_variant, variant_urls
+from storage import (
+    OBJECTS_FOLDER,
+    UploadError,
+    receive_upload,
+    store_upload,
+    update_refs,
+)
+from jobs import enqueue, get_job
+from bulk_import import import_ndjson
+from counters import comment_counts
+from db_metrics import DB_QUERY_HEADERS, add_query_headers, record_request, render_metrics
+from query_budget import init_query_budget, query_budget
+from rate_limit import rate_limit
+from static_files import STATIC_SENDFILE_MODE, send_static
+from cache_store import cache, cached_view, etag_view, invalidate, lru_stats
 from routes.debug import debug
 from routes.testDb import testdb
 from routes.auth import userData, login, register
 from routes.updateUser import updateUser
+from routes.search import search
 from routes.auth_status import auth_status
-from routes.comments import getComments, addComment, delComment
+from routes.comments import getComments, getCommentTree, addComment, delComment
 from routes.posts import (
     get_posts,
     get_post,
@@ -27,14 +45,23 @@ env_path = Path(".") / ".env"
 
 load_dotenv(dotenv_path=env_path)
 
-cache = Cache(config={"CACHE_TYPE": "SimpleCache"})
-
 application = Flask(__name__)
+# Кэш общий для всех воркеров: SQLite-файл по умолчанию, RedisCache — опционально
+application.config["CACHE_TYPE"] = os.getenv("CACHE_TYPE", "cache_store.SQLiteCache")
+application.config["CACHE_DEFAULT_TIMEOUT"] = int(os.getenv("CACHE_TIMEOUT", 600))
+application.config["CACHE_SQLITE_PATH"] = os.getenv(
+    "CACHE_SQLITE_PATH", "/tmp/blog-api-cache.sqlite3"
+)
+application.config["CACHE_REDIS_URL"] = os.getenv("CACHE_REDIS_URL")
 application.config["MAX_CONTENT_LENGTH"] = 5 * 1024 * 1024
+# Импорт NDJSON читается потоком, общий предел запроса для него слишком мал
+application.config["IMPORT_MAX_CONTENT_LENGTH"] = int(
+    os.getenv("IMPORT_MAX_CONTENT_LENGTH", 1024 * 1024 * 1024)
+)
 application.config["UPLOAD_FOLDER"] = "uploads"
 application.config["BANNER_UPLOAD_FOLDER"] = "uploads/userbanner"
+application.config["USE_X_SENDFILE"] = STATIC_SENDFILE_MODE == "x-sendfile"
 application.config["ALLOWED_EXTENSIONS"] = {"png", "jpg", "jpeg", "gif"}
-ALLOWED_MIMETYPES = {"image/jpeg", "image/png", "image/gif"}
 os.makedirs(application.config["UPLOAD_FOLDER"], exist_ok=True)
 os.makedirs(application.config["BANNER_UPLOAD_FOLDER"], exist_ok=True)
 
@@ -50,6 +77,37 @@ def allowed_file(filename):
 
 
 cache.init_app(application)
+# Инвалидация вызывается и из фоновых потоков, где нет контекста приложения
+cache.app = application
+init_query_budget(application)
+
+
+def enqueue_variants(path):
+    job_id = enqueue("process_image", {"path": path, "base_url": os.getenv("API_URL")})
+    return {"id": job_id, "statusUrl": f"{os.getenv('API_URL')}/jobs/{job_id}"}
+
+
+def upload_result(stored):
+    # Повторная загрузка: варианты уже построены (или строятся) для первой копии
+    if stored["created"]:
+        return {"job": enqueue_variants(stored["path"])}
+    manifest = load_manifest(stored["path"])
+    if manifest is None:
+        return {"job": enqueue_variants(stored["path"])}
+    return {"variants": variant_urls(manifest, os.getenv("API_URL"))}
+
+
+def send_upload(folder, filename, immutable=False):
+    variant = request.args.get("variant")
+    if variant:
+        info = pick_variant(
+            load_manifest(os.path.join(folder, secure_filename(filename))),
+            variant,
+            request.args.get("format"),
+        )
+        if info:
+            return send_static(VARIANTS_FOLDER, info["file"], immutable=True)
+    return send_static(folder, filename, immutable=immutable)
 
 
 def token_required(f):
@@ -60,11 +118,7 @@ def token_required(f):
             return {"isError": True, "message": "Токен отсутствует"}, 401
 
         try:
-            if token.startswith("Bearer "):
-                token = token[7:]
-            data = jwt.decode(
-                token, SECRET_KEY, algorithms=["HS256"], options={"require_exp": True}
-            )
+            data = decode_token(token)
             current_user = data["sub"]
         except jwt.ExpiredSignatureError:
             return {"isError": True, "message": "Токен просрочен"}, 401
@@ -80,73 +134,127 @@ def token_required(f):
     return decorated
 
 
-@application.route("/upload", methods=["POST"])
-def upload_file():
-    if "file" not in request.files:
-        return jsonify({"error": "No file part"}), 400
+def receive_file():
+    max_size = application.config["MAX_CONTENT_LENGTH"]
+    if request.content_length and request.content_length > max_size:
+        raise UploadError("Файл слишком большой", 413)
+    return receive_upload(
+        request.stream, request.content_type, max_size, allowed_name=allowed_file
+    )
 
-    file = request.files["file"]
 
-    if file.mimetype not in ALLOWED_MIMETYPES:
-        return jsonify({"error": "Invalid file content type"}), 400
+def upload_error(error, key):
+    response = jsonify({key: error.message})
+    response.status_code = error.status
+    # Остаток тела не читаем: соединение закрывается вместо дочитывания
+    response.headers["Connection"] = "close"
+    return response
 
-    if file.filename == "":
-        return jsonify({"error": "No selected file"}), 400
 
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file.save(os.path.join(application.config["UPLOAD_FOLDER"], filename))
-        file_url = f"{os.getenv('API_URL')}/uploads/{filename}"
-        return jsonify({"url": file_url}), 200
+@application.route("/upload", methods=["POST"])
+@query_budget(3)
+@rate_limit("upload")
+def upload_file():
+    try:
+        received = receive_file()
+    except UploadError as e:
+        return upload_error(e, "error")
 
-    return jsonify({"error": "Invalid file type"}), 400
+    stored = store_upload(received, "upload")
+    return jsonify({"url": stored["url"], **upload_result(stored)}), 200
 
 
 @application.route("/upload/userbanner/<int:user_id>", methods=["POST"])
+@query_budget(7)
+@rate_limit("upload")
 @token_required
 def upload_banner(current_user, user_id):
     if int(current_user) != user_id:
         return jsonify({"message": "У вас нет прав на изменение этих данных"}), 400
 
-    if not user_id or "file" not in request.files:
+    if not user_id:
         return jsonify({"message": "Некорректный запрос"}), 400
 
-    file = request.files["file"]
-
-    if file.mimetype not in ALLOWED_MIMETYPES:
-        return jsonify({"message": "Неправильный формат файла"}), 400
-
-    if file.filename == "":
-        return jsonify({"message": "Неправильный формат файла"}), 400
+    try:
+        received = receive_file()
+    except UploadError as e:
+        return upload_error(e, "message")
 
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        file.save(os.path.join(application.config["BANNER_UPLOAD_FOLDER"], filename))
-        file_url = f"{os.getenv('API_URL')}/uploads/userbanner/{filename}"
+    stored = store_upload(received, "banner", user_id)
+    file_url = stored["url"]
 
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(
-                    "UPDATE users SET banner_url = %s WHERE id = %s",
-                    (file_url, current_user),
-                )
-                cursor.connection.commit()
-
-                return jsonify(
-                    {"message": "Баннер успешно изменен", "bannerUrl": file_url}
-                ), 200
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT banner_url FROM users WHERE id = %s FOR UPDATE", (current_user,)
+            )
+            previous = cursor.fetchone()
+            cursor.execute(
+                "UPDATE users SET banner_url = %s WHERE id = %s",
+                (file_url, current_user),
+            )
+            # Ссылка переходит со старого баннера на новый; тот же баннер — без изменений
+            update_refs(cursor, previous["banner_url"] if previous else None, file_url)
+            cursor.connection.commit()
+            invalidate(f"user:{int(current_user)}")
 
-    return jsonify({"message": "Некорректный запрос"}), 400
+    return jsonify(
+        {
+            "message": "Баннер успешно изменен",
+            "bannerUrl": file_url,
+            **upload_result(stored),
+        }
+    ), 200
 
 
 @application.route("/uploads/<filename>")
 def serve_uploaded_file(filename):
-    return send_from_directory(application.config["UPLOAD_FOLDER"], filename)
+    return send_upload(application.config["UPLOAD_FOLDER"], filename)
 
 
 @application.route("/uploads/userbanner/<filename>")
 def serve_uploaded_banner(filename):
-    return send_from_directory(application.config["BANNER_UPLOAD_FOLDER"], filename)
+    return send_upload(application.config["BANNER_UPLOAD_FOLDER"], filename)
+
+
+@application.route("/uploads/objects/<shard1>/<shard2>/<filename>")
+def serve_upload_object(shard1, shard2, filename):
+    # Имя объекта — хеш содержимого, файл никогда не меняется
+    folder = os.path.join(OBJECTS_FOLDER, secure_filename(shard1), secure_filename(shard2))
+    return send_upload(folder, filename, immutable=True)
+
+
+@application.route("/uploads/variants/<filename>")
+def serve_image_variant(filename):
+    # Имя варианта — хеш содержимого, файл никогда не меняется
+    return send_static(VARIANTS_FOLDER, filename, immutable=True)
+
+
+@application.route("/jobs/<int:job_id>", methods=["GET"])
+def jobStatus(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"message": "Задача не найдена"}), 404
+    return jsonify(job)
+
+
+@application.after_request
+def count_db_queries(response):
+    record_request(request.endpoint)
+    if DB_QUERY_HEADERS:
+        add_query_headers(response)
+    return response
+
+
+@application.route("/metrics", methods=["GET"])
+def metrics():
+    # Если задан METRICS_TOKEN, Prometheus должен прислать его в Authorization
+    metrics_token = os.getenv("METRICS_TOKEN")
+    if metrics_token and request.headers.get("Authorization") != f"Bearer {metrics_token}":
+        return jsonify({"message": "Нет доступа"}), 403
+    return render_metrics(get_pool_stats()), 200, {
+        "Content-Type": "text/plain; version=0.0.4; charset=utf-8"
+    }
 
 
 @application.route("/")
@@ -166,6 +274,24 @@ def apiTest():
     return testdb()
 
 
+@application.route("/stats/pool", methods=["GET"])
+@token_required
+def poolStats(current_user):
+    return jsonify(get_pool_stats())
+
+
+@application.route("/stats/cache", methods=["GET"])
+@token_required
+def cacheStats(current_user):
+    return jsonify(
+        {
+            **lru_stats(),
+            "tokens": token_cache.stats(),
+            "comment_counts": comment_counts.stats(),
+        }
+    )
+
+
 @application.route("/status", methods=["GET"])
 @token_required
 def userStatus(current_user):
@@ -173,44 +299,57 @@ def userStatus(current_user):
 
 
 @application.route("/login", methods=["POST"])
+@query_budget(4)
+@rate_limit("login")
 def userLogin():
     return login()
 
 
 @application.route("/register", methods=["POST"])
+@query_budget(2)
+@rate_limit("register")
 def userRegistration():
     return register()
 
 
 @application.route("/profile/<int:target_user_id>", methods=["GET"])
+@query_budget(2)
+@etag_view(tags=lambda target_user_id: [f"user:{target_user_id}"])
 def getUser(target_user_id):
     return userData(target_user_id)
 
 
 @application.route("/profile/<int:user_id>", methods=["PATCH"])
+@query_budget(4)
 @token_required
 def updateUserInfo(current_user, user_id):
     return updateUser(current_user, user_id)
 
 
 @application.route("/posts", methods=["GET"])  # РАБОТАЕТ
-@cache.cached(timeout=60)
+@query_budget(2)
+@etag_view(tags=["posts"])
+@cached_view(tags=["posts"])
 def get_all_post():
     return get_posts()
 
 
 @application.route("/posts/<int:post_id>", methods=["GET"])  # РАБОТАЕТ
+@query_budget(2)
+@etag_view(tags=lambda post_id: [f"post:{post_id}", "nicknames"])
 def get_single_post(post_id):
     return get_post(post_id)
 
 
 @application.route("/posts/create", methods=["POST"])  # РАБОТАЕТ
+@query_budget(5)
 @token_required
 def create_new_post(current_user):
     return new_post(current_user)
 
 
 @application.route("/posts/<int:post_id>", methods=["PATCH", "DELETE"])  # МЫ ТУТ
+@query_budget(4)
 @token_required
 def post_detail(current_user, post_id):
     if request.method == "PATCH":
@@ -220,23 +359,63 @@ def post_detail(current_user, post_id):
 
 
 @application.route("/posts/option/<int:post_id>", methods=["PATCH"])
+@query_budget(2)
 @token_required
 def toggle_post_option(current_user, post_id):
     return toggle_option(current_user, post_id)
 
 
+@application.route("/search", methods=["GET"])
+@query_budget(2)
+def searchPosts():
+    return search()
+
+
 @application.route("/posts/<int:post_id>/comments", methods=["GET"])
+@query_budget(2)
+@etag_view(tags=lambda post_id: [f"comments:{post_id}", "nicknames"])
 def getPostComments(post_id):
     return getComments(post_id)
 
 
+@application.route("/posts/<int:post_id>/comments/tree", methods=["GET"])
+@query_budget(3)
+@etag_view(tags=lambda post_id: [f"comments:{post_id}", "nicknames"])
+def getPostCommentTree(post_id):
+    return getCommentTree(post_id)
+
+
 @application.route("/posts/<int:post_id>/comments", methods=["POST"])
+@query_budget(4)
+@rate_limit("comment")
 @token_required
 def addCommentToPost(current_user, post_id):
     return addComment(current_user, post_id)
 
 
+@application.route("/import", methods=["POST"])
+@query_budget(None)
+@token_required
+def bulkImport(current_user):
+    if int(current_user) != 1:
+        return jsonify({"message": "У вас нет прав на импорт"}), 403
+
+    request.max_content_length = application.config["IMPORT_MAX_CONTENT_LENGTH"]
+    try:
+        stats = import_ndjson(request.stream)
+    except HTTPException:
+        # 413 при превышении предела и прочие ответы werkzeug — как есть
+        raise
+    except Exception as e:
+        return jsonify({"message": "Ошибка импорта", "detail": str(e)}), 500
+
+    # Кэш import_ndjson сбрасывает сам
+    stats.pop("affected_posts")
+    return jsonify({"message": "Импорт завершен", **stats})
+
+
 @application.route("/comments/<int:comment_id>", methods=["DELETE"])
+@query_budget(3)
 @token_required
 def delPostComment(current_user, comment_id):
     return delComment(current_user, comment_id)
@@ -0,0 +1,472 @@
+"""Нагрузочный прогон по маршрутам API: RPS, p50/p95/p99 и запросы к БД.
+
+Нужна отдельная база MySQL из .env (схема из migrations/). Сначала она
+заполняется синтетическими данными, потом каждый маршрут по очереди
+нагружается с фиксированной конкурентностью, результат пишется в JSON:
+
+    python bench/routes.py seed --users 1000 --posts 10000 --comments 100000
+    python bench/routes.py run --concurrency 16 --duration 10 --output bench/results/base.json
+    python bench/routes.py compare bench/results/base.json bench/results/new.json
+
+Сервер поднимается сам (gunicorn, DB_QUERY_HEADERS=1, RATE_LIMIT_ENABLED=0), либо можно указать
+--url уже запущенного; без DB_QUERY_HEADERS=1 на нем запросы к БД не считаются.
+compare завершается с кодом 1, если какой-то маршрут просел больше --threshold %.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+from serving import percentile, wait_for_port
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+BENCH_EMAIL_DOMAIN = "bench.local"
+BENCH_PASSWORD = "bench-password"
+TOKEN_USERS = 20
+ID_SAMPLE = 5000
+
+WORDS = (
+    "блог пост сервер запрос кэш индекс база данных поток воркер очередь "
+    "python flask mysql gunicorn latency throughput профиль комментарий поиск "
+    "картинка загрузка лента автор заметка релиз ошибка тест нагрузка память"
+).split()
+
+
+def zipf_weights(n, s=1.1):
+    # Популярность по закону Ципфа: немногие авторы/посты собирают большую часть
+    return [1 / (rank**s) for rank in range(1, n + 1)]
+
+
+def make_text(rng, mean_words):
+    # Длина текста — логнормальная: много коротких, редкие длинные
+    count = max(3, int(rng.lognormvariate(0, 0.8) * mean_words))
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def make_png(rng):
+    # PNG 1x1 со случайным цветом: каждая загрузка — новый объект в хранилище
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    pixel = bytes([0, rng.randrange(256), rng.randrange(256), rng.randrange(256)])
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(pixel))
+        + chunk(b"IEND", b"")
+    )
+
+
+# --- seed -----------------------------------------------------------------
+
+
+def seed(args):
+    import bcrypt
+    from bulk_import import import_ndjson
+    from config import get_db_connection
+
+    rng = random.Random(args.seed)
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt(args.bcrypt_rounds))
+
+    started = time.perf_counter()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            rows = [
+                (f"bench{n}@{BENCH_EMAIL_DOMAIN}", password_hash.decode(), f"bench{n}")
+                for n in range(args.users)
+            ]
+            for start in range(0, len(rows), 1000):
+                cursor.executemany(
+                    "INSERT IGNORE INTO users (email, password_hash, nickname) VALUES (%s, %s, %s)",
+                    rows[start : start + 1000],
+                )
+            conn.commit()
+            cursor.execute(
+                "SELECT id FROM users WHERE email LIKE %s ORDER BY id",
+                (f"bench%@{BENCH_EMAIL_DOMAIN}",),
+            )
+            user_ids = [row["id"] for row in cursor.fetchall()]
+            cursor.execute("SELECT COALESCE(MAX(id), 0) AS id FROM posts")
+            first_post = cursor.fetchone()["id"] + 1
+            cursor.execute("SELECT COALESCE(MAX(id), 0) AS id FROM comments")
+            first_comment = cursor.fetchone()["id"] + 1
+
+    user_weights = zipf_weights(len(user_ids))
+    post_ids = list(range(first_post, first_post + args.posts))
+    post_weights = zipf_weights(len(post_ids))
+    now = datetime.now()
+
+    def records():
+        for post_id in post_ids:
+            yield {
+                "type": "post",
+                "id": post_id,
+                "author_id": rng.choices(user_ids, user_weights)[0],
+                "title": make_text(rng, 5)[:200],
+                "content": make_text(rng, 250),
+                "created_at": (now - timedelta(minutes=rng.randrange(525600))).isoformat(" ", "seconds"),
+            }
+        thread_comments = {}
+        for comment_id in range(first_comment, first_comment + args.comments):
+            post_id = rng.choices(post_ids, post_weights)[0]
+            siblings = thread_comments.setdefault(post_id, [])
+            # Примерно треть комментариев — ответы в уже идущем обсуждении
+            parent_id = rng.choice(siblings) if siblings and rng.random() < 0.3 else None
+            siblings.append(comment_id)
+            yield {
+                "type": "comment",
+                "id": comment_id,
+                "post_id": post_id,
+                "user_id": rng.choices(user_ids, user_weights)[0],
+                "content": make_text(rng, 30),
+                "parent_id": parent_id,
+            }
+
+    from app import application
+    from cache_store import invalidate
+
+    # import_ndjson сам сбрасывает кэш ленты и постов, ему нужен контекст приложения
+    with application.app_context():
+        stats = import_ndjson((json.dumps(r, ensure_ascii=False) for r in records()), args.batch_size)
+        invalidate("nicknames")
+    stats.pop("affected_posts")
+    stats.update({"users": len(user_ids), "seconds": round(time.perf_counter() - started, 1)})
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+# --- run ------------------------------------------------------------------
+
+
+class Target:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    def connect(self):
+        return http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def request(self, method, path, body=None, headers=None):
+        conn = self.connect()
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+
+
+def load_fixture():
+    from config import get_db_connection
+
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT id, email FROM users WHERE email LIKE %s ORDER BY id LIMIT %s",
+                (f"bench%@{BENCH_EMAIL_DOMAIN}", ID_SAMPLE),
+            )
+            users = cursor.fetchall()
+            cursor.execute("SELECT id FROM posts ORDER BY id DESC LIMIT %s", (ID_SAMPLE,))
+            post_ids = [row["id"] for row in cursor.fetchall()]
+    if not users or not post_ids:
+        sys.exit("База пустая: сначала python bench/routes.py seed")
+    return users, post_ids
+
+
+def login_users(target, users):
+    tokens = []
+    for user in users[:TOKEN_USERS]:
+        status, body = target.request(
+            "POST",
+            "/login",
+            json.dumps({"email": user["email"], "password": BENCH_PASSWORD}),
+            {"Content-Type": "application/json"},
+        )
+        if status == 200:
+            tokens.append((user["id"], json.loads(body)["token"]))
+    if not tokens:
+        sys.exit("Не удалось войти ни под одним bench-пользователем")
+    return tokens
+
+
+def build_scenarios(users, post_ids, tokens):
+    user_ids = [user["id"] for user in users]
+    user_weights = zipf_weights(len(user_ids))
+    post_weights = zipf_weights(len(post_ids))
+
+    def post(rng):
+        return rng.choices(post_ids, post_weights)[0]
+
+    def auth(rng):
+        user_id, token = rng.choice(tokens)
+        return user_id, {"Authorization": f"Bearer {token}"}
+
+    def json_request(method, path, payload, headers=None):
+        headers = {"Content-Type": "application/json", **(headers or {})}
+        return method, path, json.dumps(payload, ensure_ascii=False).encode(), headers
+
+    def feed(rng):
+        fields = "&fields=summary" if rng.random() < 0.5 else ""
+        return "GET", f"/posts?limit=20{fields}", None, {}
+
+    def login(rng):
+        user = rng.choice(users[:TOKEN_USERS])
+        return json_request("POST", "/login", {"email": user["email"], "password": BENCH_PASSWORD})
+
+    def add_comment(rng):
+        post_id = post(rng)
+        user_id, headers = auth(rng)
+        payload = {"post_id": post_id, "user_id": user_id, "content": make_text(rng, 20)}
+        return json_request("POST", f"/posts/{post_id}/comments", payload, headers)
+
+    def upload(rng):
+        boundary = uuid.uuid4().hex
+        body = (
+            f"--{boundary}\r\n"
+            'Content-Disposition: form-data; name="file"; filename="bench.png"\r\n'
+            "Content-Type: image/png\r\n\r\n"
+        ).encode() + make_png(rng) + f"\r\n--{boundary}--\r\n".encode()
+        return "POST", "/upload", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+    return {
+        "feed": feed,
+        "post": lambda rng: ("GET", f"/posts/{post(rng)}", None, {}),
+        "comments": lambda rng: ("GET", f"/posts/{post(rng)}/comments", None, {}),
+        "comment_tree": lambda rng: ("GET", f"/posts/{post(rng)}/comments/tree", None, {}),
+        "profile": lambda rng: ("GET", f"/profile/{rng.choices(user_ids, user_weights)[0]}", None, {}),
+        "search": lambda rng: ("GET", f"/search?q={quote(rng.choice(WORDS))}", None, {}),
+        "login": login,
+        "add_comment": add_comment,
+        "upload": upload,
+    }
+
+
+def run_scenario(target, make_request, concurrency, duration, seed_value):
+    latencies = []
+    queries = []
+    db_times = []
+    statuses = {}
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def worker(n):
+        rng = random.Random(seed_value * 1000 + n)
+        conn = target.connect()
+        local = ([], [], [], {})
+        while time.monotonic() < stop_at:
+            method, path, body, headers = make_request(rng)
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                local[3]["error"] = local[3].get("error", 0) + 1
+                conn.close()
+                conn = target.connect()
+                continue
+            local[0].append(time.perf_counter() - started)
+            local[3][response.status] = local[3].get(response.status, 0) + 1
+            if response.getheader("X-DB-Queries") is not None:
+                local[1].append(int(response.getheader("X-DB-Queries")))
+                local[2].append(float(response.getheader("X-DB-Time-Ms")))
+            if response.getheader("Connection") == "close":
+                conn.close()
+                conn = target.connect()
+        conn.close()
+        with lock:
+            latencies.extend(local[0])
+            queries.extend(local[1])
+            db_times.extend(local[2])
+            for status, count in local[3].items():
+                statuses[str(status)] = statuses.get(str(status), 0) + count
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    errors = sum(
+        count for status, count in statuses.items() if status == "error" or int(status) >= 500
+    )
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+        "max_queries": max(queries) if queries else None,
+        "db_ms_per_request": round(sum(db_times) / len(db_times), 2) if db_times else None,
+    }
+
+
+def start_server(args):
+    env = dict(
+        os.environ,
+        DB_QUERY_HEADERS="1",
+        # Лимитер отрезал бы login/upload с одного IP уже на первых секундах
+        RATE_LIMIT_ENABLED="0",
+        GUNICORN_WORKER_CLASS=args.worker_class,
+        GUNICORN_BIND=f"127.0.0.1:{args.port}",
+        GUNICORN_WORKERS=str(args.workers),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:application"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    if not wait_for_port(args.port):
+        server.terminate()
+        sys.exit("Сервер не запустился")
+    return server
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    users, post_ids = load_fixture()
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        target = Target(parts.hostname, parts.port or 80)
+    else:
+        server = start_server(args)
+        target = Target("127.0.0.1", args.port)
+
+    try:
+        tokens = login_users(target, users)
+        scenarios = build_scenarios(users, post_ids, tokens)
+        selected = args.route or list(scenarios)
+        results = {}
+        for n, name in enumerate(selected):
+            run_scenario(target, scenarios[name], args.concurrency, min(2, args.duration), n)  # прогрев
+            results[name] = run_scenario(
+                target, scenarios[name], args.concurrency, args.duration, args.seed + n
+            )
+            print(name, results[name], file=sys.stderr)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "workers": None if args.url else args.workers,
+            "worker_class": None if args.url else args.worker_class,
+            "users": len(users),
+            "posts_sampled": len(post_ids),
+        },
+        "routes": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+# --- compare --------------------------------------------------------------
+
+
+def compare(args):
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))["routes"]
+    new = json.loads(Path(args.new).read_text(encoding="utf-8"))["routes"]
+    limit = args.threshold / 100
+    regressions = []
+
+    print(f"{'route':<14}{'rps':>18}{'p95, ms':>20}{'queries':>14}")
+    for name in sorted(set(base) & set(new)):
+        old, cur = base[name], new[name]
+        problems = []
+        if old["rps"] and cur["rps"] < old["rps"] * (1 - limit):
+            problems.append("rps")
+        if old["p95_ms"] and cur["p95_ms"] > old["p95_ms"] * (1 + limit):
+            problems.append("p95")
+        # Число запросов к БД не шумит, любое увеличение — регрессия
+        if (cur["queries_per_request"] or 0) > (old["queries_per_request"] or 0) + 0.01:
+            problems.append("queries")
+        if problems:
+            regressions.append((name, problems))
+        print(
+            f"{name:<14}"
+            f"{old['rps']:>9} → {cur['rps']:<6}"
+            f"{old['p95_ms']:>10} → {cur['p95_ms']:<7}"
+            f"{old['queries_per_request'] or '-':>6} → {cur['queries_per_request'] or '-':<5}"
+            f"{' РЕГРЕССИЯ: ' + ', '.join(problems) if problems else ''}"
+        )
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="заполнить базу синтетическими данными")
+    seed_parser.add_argument("--users", type=int, default=1000)
+    seed_parser.add_argument("--posts", type=int, default=10000)
+    seed_parser.add_argument("--comments", type=int, default=100000)
+    seed_parser.add_argument("--batch-size", type=int, default=1000)
+    seed_parser.add_argument("--bcrypt-rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", 12)))
+    seed_parser.add_argument("--seed", type=int, default=1)
+
+    run_parser = commands.add_parser("run", help="нагрузить маршруты")
+    run_parser.add_argument("--route", action="append")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--duration", type=float, default=10)
+    run_parser.add_argument("--workers", type=int, default=2)
+    run_parser.add_argument("--worker-class", default="gthread")
+    run_parser.add_argument("--port", type=int, default=18100)
+    run_parser.add_argument("--url", help="уже запущенный сервер вместо gunicorn")
+    run_parser.add_argument("--output")
+    run_parser.add_argument("--seed", type=int, default=1)
+
+    compare_parser = commands.add_parser("compare", help="сравнить два прогона")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=10)
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        seed(args)
+    elif args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""Массовый импорт постов и комментариев из NDJSON.
+
+Одна строка — одна запись:
+
+    {"type": "post", "id": 10, "author_id": 1, "title": "...", "content": "...", "created_at": "2024-01-31 12:00:00"}
+    {"type": "comment", "post_id": 10, "user_id": 2, "content": "...", "parent_id": null}
+
+id необязателен (для постов и комментариев), но нужен, если на запись ссылаются
+следующие строки. Запуск из консоли:
+
+    python bulk_import.py comments.ndjson [--batch-size 1000]
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+import pymysql
+from config import get_db_connection
+from storage import update_refs
+from cache_store import invalidate
+from search_index import post_search_text, stem_text
+from routes.posts import build_summary
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 50
+
+POST_SQL = """INSERT INTO posts
+    (id, title, content, author_id, author_nickname, excerpt, word_count, reading_time,
+     search_text, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+
+COMMENT_SQL = """INSERT INTO comments
+    (id, post_id, user_id, author_nickname, content, search_text, parent_id, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"""
+
+
+def parse_time(value):
+    if value is None:
+        return datetime.now()
+    return datetime.fromisoformat(value)
+
+
+class Importer:
+    def __init__(self, conn, batch_size=BATCH_SIZE):
+        self.conn = conn
+        self.batch_size = batch_size
+        self.posts = []
+        self.comments = []
+        self.nicknames = {}
+        self.affected_posts = set()
+        self.stats = {"posts": 0, "comments": 0, "errors": [], "skipped": 0, "failed": 0}
+
+    def report_error(self, error):
+        if len(self.stats["errors"]) < MAX_REPORTED_ERRORS:
+            self.stats["errors"].append(error)
+
+    def load_nicknames(self, user_ids):
+        missing = [user_id for user_id in user_ids if user_id not in self.nicknames]
+        if not missing:
+            return
+        with self.conn.cursor() as cursor:
+            placeholders = ", ".join(["%s"] * len(missing))
+            cursor.execute(
+                f"SELECT id, nickname FROM users WHERE id IN ({placeholders})", missing
+            )
+            for row in cursor.fetchall():
+                self.nicknames[row["id"]] = row["nickname"]
+
+    def add(self, number, record):
+        # Проверяем запись сразу, чтобы одна битая строка не уронила всю пачку
+        kind = record.get("type")
+        if kind == "post":
+            for field in ("title", "content", "author_id"):
+                if not record.get(field):
+                    raise KeyError(field)
+            int(record["author_id"])
+            parse_time(record.get("created_at"))
+            self.posts.append((number, record))
+        elif kind == "comment":
+            for field in ("post_id", "user_id", "content"):
+                if not record.get(field):
+                    raise KeyError(field)
+            int(record["post_id"]), int(record["user_id"])
+            parse_time(record.get("created_at"))
+            self.comments.append((number, record))
+        else:
+            raise ValueError("неизвестный type")
+
+        if len(self.posts) + len(self.comments) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.posts and not self.comments:
+            return
+        posts = [record for _, record in self.posts]
+        comments = [record for _, record in self.comments]
+        lines = [number for number, _ in self.posts + self.comments]
+        self.posts = []
+        self.comments = []
+
+        # Упавшая пачка (дубликат id, слишком длинный заголовок, strict mode)
+        # откатывается целиком, импорт продолжается со следующей
+        try:
+            self.write(posts, comments)
+        except pymysql.MySQLError as e:
+            try:
+                self.conn.rollback()
+            except pymysql.MySQLError:
+                pass
+            self.stats["failed"] += len(lines)
+            self.report_error({"lines": [min(lines), max(lines)], "error": str(e)})
+
+    def write(self, posts, comments):
+        self.load_nicknames(
+            {int(r["author_id"]) for r in posts}
+            | {int(r["user_id"]) for r in comments}
+        )
+
+        post_rows = []
+        for r in posts:
+            summary = build_summary(r["content"])
+            post_rows.append(
+                (
+                    r.get("id"),
+                    r["title"],
+                    r["content"],
+                    int(r["author_id"]),
+                    self.nicknames.get(int(r["author_id"]), ""),
+                    summary["excerpt"],
+                    summary["word_count"],
+                    summary["reading_time"],
+                    post_search_text(r["title"], r["content"]),
+                    parse_time(r.get("created_at")),
+                )
+            )
+
+        comment_rows = []
+        for r in comments:
+            comment_rows.append(
+                (
+                    r.get("id"),
+                    int(r["post_id"]),
+                    int(r["user_id"]),
+                    self.nicknames.get(int(r["user_id"]), ""),
+                    r["content"],
+                    stem_text(r["content"]),
+                    r.get("parent_id"),
+                    parse_time(r.get("created_at")),
+                )
+            )
+
+        # Одна транзакция на пачку; executemany в pymysql склеивает
+        # строки в многострочный INSERT
+        with self.conn.cursor() as cursor:
+            if post_rows:
+                cursor.executemany(POST_SQL, post_rows)
+                # Картинки в тексте постов — ссылки на загруженные объекты
+                update_refs(cursor, None, "\n".join(r["content"] for r in posts))
+            if comment_rows:
+                cursor.executemany(COMMENT_SQL, comment_rows)
+        self.conn.commit()
+
+        self.stats["posts"] += len(post_rows)
+        self.stats["comments"] += len(comment_rows)
+        self.affected_posts.update(row[1] for row in comment_rows)
+
+    def recount_comments(self):
+        # comment_count пересчитывается один раз на затронутый пост
+        post_ids = sorted(self.affected_posts)
+        with self.conn.cursor() as cursor:
+            for start in range(0, len(post_ids), self.batch_size):
+                chunk = post_ids[start : start + self.batch_size]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(
+                    f"""UPDATE posts p
+                        LEFT JOIN (
+                            SELECT post_id, COUNT(*) AS total FROM comments
+                            WHERE post_id IN ({placeholders})
+                            GROUP BY post_id
+                        ) c ON c.post_id = p.id
+                        SET p.comment_count = COALESCE(c.total, 0)
+                        WHERE p.id IN ({placeholders})""",
+                    chunk + chunk,
+                )
+                self.conn.commit()
+
+
+def import_ndjson(lines, batch_size=BATCH_SIZE):
+    started = time.perf_counter()
+    with get_db_connection() as conn:
+        importer = Importer(conn, batch_size)
+        try:
+            for number, line in enumerate(lines, 1):
+                if isinstance(line, bytes):
+                    line = line.decode("utf-8")
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    importer.add(number, json.loads(line))
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    importer.stats["skipped"] += 1
+                    importer.report_error({"line": number, "error": str(e)})
+            importer.flush()
+        finally:
+            # Даже если импорт оборвался, уже закоммиченные пачки должны
+            # попасть в comment_count и в кэш
+            affected = sorted(importer.affected_posts)
+            try:
+                if affected:
+                    importer.recount_comments()
+            finally:
+                if importer.stats["posts"] or importer.stats["comments"]:
+                    invalidate(
+                        "posts",
+                        *(f"post:{post_id}" for post_id in affected),
+                        *(f"comments:{post_id}" for post_id in affected),
+                    )
+
+    elapsed = time.perf_counter() - started
+    stats = importer.stats
+    rows = stats["posts"] + stats["comments"]
+    stats.update(
+        {
+            "affected_posts": affected,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(rows / elapsed, 1) if elapsed else rows,
+        }
+    )
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт постов и комментариев из NDJSON")
+    parser.add_argument("path", help="файл NDJSON или - для stdin")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    # Контекст приложения нужен для сброса кэша после импорта
+    from app import application
+
+    with application.app_context():
+        if args.path == "-":
+            stats = import_ndjson(sys.stdin, args.batch_size)
+        else:
+            with open(args.path, encoding="utf-8") as f:
+                stats = import_ndjson(f, args.batch_size)
+
+    stats.pop("affected_posts")
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+import hashlib
+import logging
+import os
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response
+from flask_caching import Cache
+from flask_caching.backends.base import BaseCache
+
+cache = Cache()
+log = logging.getLogger(__name__)
+
+
+class SQLiteCache(BaseCache):
+    # Общий для всех воркеров gunicorn кэш в одном файле SQLite (WAL)
+    def __init__(self, path, default_timeout=300, cleanup_chance=0.01):
+        super().__init__(default_timeout)
+        self.path = path
+        self.cleanup_chance = cleanup_chance
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires REAL NOT NULL
+                )"""
+            )
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.setdefault(
+            "path", config.get("CACHE_SQLITE_PATH", "/tmp/blog-api-cache.sqlite3")
+        )
+        return cls(*args, **kwargs)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _expires_at(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        # 0 — без срока жизни
+        return time.time() + timeout if timeout else 0
+
+    def _maybe_cleanup(self, conn):
+        if random.random() < self.cleanup_chance:
+            conn.execute(
+                "DELETE FROM cache WHERE expires != 0 AND expires < ?", (time.time(),)
+            )
+
+    def get(self, key):
+        row = (
+            self._connect()
+            .execute("SELECT value, expires FROM cache WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None:
+            return None
+        value, expires = row
+        if expires and expires < time.time():
+            return None
+        try:
+            return pickle.loads(value)
+        except Exception:
+            return None
+
+    def get_many(self, *keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires_at(timeout)),
+        )
+        self._maybe_cleanup(conn)
+        return True
+
+    def add(self, key, value, timeout=None):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM cache WHERE key = ? AND expires != 0 AND expires < ?",
+                (key, time.time()),
+            )
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                (
+                    key,
+                    pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                    self._expires_at(timeout),
+                ),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount == 1
+
+    def delete(self, key):
+        cur = self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+        return cur.rowcount == 1
+
+    def has(self, key):
+        row = (
+            self._connect()
+            .execute(
+                "SELECT 1 FROM cache WHERE key = ? AND (expires = 0 OR expires >= ?)",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row is not None
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+        return True
+
+    def inc(self, key, delta=1):
+        # Атомарно между процессами благодаря BEGIN IMMEDIATE
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            value = 0
+            expires = 0
+            if row is not None and not (row[1] and row[1] < time.time()):
+                value = pickle.loads(row[0])
+                expires = row[1]
+            value = int(value) + delta
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def dec(self, key, delta=1):
+        return self.inc(key, -delta)
+
+
+def _tag_key(tag):
+    return f"tag:{tag}"
+
+
+def tag_versions(tags):
+    # Версии тегов хранятся бессрочно; инвалидация = увеличение версии,
+    # поэтому старые записи просто перестают находиться и доживают свой TTL
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(*keys) if keys else []
+    result = []
+    for key, version in zip(keys, versions):
+        if version is None:
+            # Случайная начальная версия: после очистки кэша ETag-и не повторятся
+            cache.add(key, random.getrandbits(48), timeout=0)
+            version = cache.get(key) or 1
+        result.append(version)
+    return result
+
+
+def invalidate(*tags):
+    for tag in tags:
+        key = _tag_key(tag)
+        try:
+            # Отсутствующий тег (кэш очищен) стартует со случайной версии, как в
+            # tag_versions; иначе inc начнет с 1 и ETag-и повторят старые
+            cache.add(key, random.getrandbits(48), timeout=0)
+            cache.cache.inc(key)
+        except Exception:
+            log.exception("Cache invalidation error (%s)", tag)
+
+
+def etag_view(tags=()):
+    # ETag считается из версий тегов ещё до запроса в базу, поэтому
+    # на If-None-Match можно ответить 304 без JOIN-ов
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            view_tags = tags(*args, **kwargs) if callable(tags) else tags
+            try:
+                versions = tag_versions(view_tags)
+            except Exception:
+                log.exception("Cache error")
+                return f(*args, **kwargs)
+
+            digest = hashlib.sha1()
+            digest.update(request.full_path.encode("utf-8"))
+            # Ответ /profile зависит от того, кто спрашивает
+            digest.update((request.headers.get("Authorization") or "").encode("utf-8"))
+            digest.update(",".join(str(v) for v in versions).encode("utf-8"))
+            etag = digest.hexdigest()
+
+            if request.if_none_match.contains(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "no-cache"
+            response.vary.add("Authorization")
+            return response
+
+        return decorated
+
+    return decorator
+
+
+def cached_view(timeout=None, tags=()):
+    # tags — список строк или функция от аргументов view, возвращающая список
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            view_tags = tags(*args, **kwargs) if callable(tags) else tags
+            try:
+                versions = tag_versions(view_tags)
+                key = "view:{}:{}".format(
+                    request.full_path, ",".join(str(v) for v in versions)
+                )
+                hit = cache.get(key)
+            except Exception:
+                log.exception("Cache error")
+                return f(*args, **kwargs)
+
+            if hit is not None:
+                body, status, content_type = hit
+                response = make_response(body, status)
+                response.content_type = content_type
+                return response
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                try:
+                    cache.set(
+                        key,
+                        (response.get_data(), 200, response.content_type),
+                        timeout=timeout,
+                    )
+                except Exception:
+                    log.exception("Cache error")
+            return response
+
+        return decorated
+
+    return decorator
+
+
+class LRUCache:
+    # Кэш внутри воркера: ограничен числом записей и TTL. Запись помнит версии
+    # своих тегов из общего кэша, так что инвалидация из другого воркера тоже видна
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            entry_versions, value, expires = entry
+            if expires < time.monotonic() or entry_versions != versions:
+                del self._data[key]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, versions, value):
+        with self._lock:
+            self._data[key] = (versions, value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "size": len(self._data), "maxsize": self.maxsize}
+
+
+post_cache = LRUCache(
+    maxsize=int(os.getenv("POST_CACHE_SIZE", 1024)),
+    ttl=int(os.getenv("POST_CACHE_TTL", 300)),
+)
+profile_cache = LRUCache(
+    maxsize=int(os.getenv("PROFILE_CACHE_SIZE", 1024)),
+    ttl=int(os.getenv("PROFILE_CACHE_TTL", 300)),
+)
+
+
+def read_through(lru, key, tags, loader):
+    # None из loader не кэшируется (например, пост не найден)
+    try:
+        versions = tag_versions(tags)
+    except Exception:
+        log.exception("Cache error")
+        return loader()
+
+    value = lru.get(key, versions)
+    if value is not None:
+        return value
+
+    value = loader()
+    if value is not None:
+        lru.set(key, versions, value)
+    return value
+
+
+def lru_stats():
+    return {"posts": post_cache.stats(), "profiles": profile_cache.stats()}
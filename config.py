@@ -2,6 +2,7 @@ from dotenv import load_dotenv
 import os
 import pymysql
 import pymysql.cursors
+from db_pool import ConnectionPool
 
 load_dotenv()
 
@@ -16,6 +17,19 @@ db_config = {
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 
+db_pool = ConnectionPool(
+    db_config,
+    min_size=int(os.getenv("DB_POOL_MIN_SIZE", 1)),
+    max_size=int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+    timeout=float(os.getenv("DB_POOL_TIMEOUT", 5)),
+    idle_timeout=float(os.getenv("DB_POOL_IDLE_TIMEOUT", 300)),
+    max_lifetime=float(os.getenv("DB_POOL_MAX_LIFETIME", 3600)),
+)
+
 
 def get_db_connection():
-    return pymysql.connect(**db_config)
+    return db_pool.acquire()
+
+
+def get_pool_stats():
+    return db_pool.stats()
@@ -0,0 +1,170 @@
+"""Отложенная запись posts.comment_count.
+
+addComment/delComment не трогают строку поста, а отмечают пост в памяти
+воркера. Раз в COMMENT_COUNT_FLUSH_MS или после COMMENT_COUNT_FLUSH_EVENTS
+событий отмеченные посты пересчитываются по таблице comments одним UPDATE.
+Сброс пишет абсолютное значение, а не дельту, поэтому повторный или
+одновременный с другим воркером сброс ничего не задваивает. Если воркер
+убит до сброса, счетчик поправит следующий комментарий к посту или сверка:
+
+    python counters.py reconcile
+
+Сверку можно запускать в любое время, она тоже пишет абсолютные значения.
+"""
+
+import atexit
+import logging
+import os
+import sys
+import threading
+from config import get_db_connection
+from cache_store import invalidate
+
+COMMENT_COUNT_FLUSH_MS = int(os.getenv("COMMENT_COUNT_FLUSH_MS", 1000))
+COMMENT_COUNT_FLUSH_EVENTS = int(os.getenv("COMMENT_COUNT_FLUSH_EVENTS", 100))
+RECONCILE_BATCH_SIZE = 1000
+FLUSH_BATCH_SIZE = 1000
+
+log = logging.getLogger(__name__)
+
+
+class CounterBuffer:
+    def __init__(self, flush_ms, flush_events):
+        self.flush_interval = flush_ms / 1000
+        self.flush_events = flush_events
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._dirty = set()
+        self._events = 0
+        self._pid = None
+        self._stats = {"events": 0, "flushes": 0, "rows_written": 0, "errors": 0}
+
+    def _ensure_thread(self):
+        # Поток сброса запускается лениво в каждом воркере (после fork)
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._dirty = set()
+        self._events = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def touch(self, post_id):
+        with self._lock:
+            self._ensure_thread()
+            self._dirty.add(int(post_id))
+            self._events += 1
+            self._stats["events"] += 1
+            if self._events >= self.flush_events:
+                self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Поток сброса не должен умирать: иначе счетчики встанут до рестарта
+                log.exception("Comment count flush failed")
+
+    def flush(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            self._events = 0
+        if not dirty:
+            return
+
+        try:
+            # Сортировка по id — одинаковый порядок блокировок во всех воркерах
+            post_ids = sorted(dirty)
+            with get_db_connection() as conn:
+                with conn.cursor() as cursor:
+                    for start in range(0, len(post_ids), FLUSH_BATCH_SIZE):
+                        chunk = post_ids[start : start + FLUSH_BATCH_SIZE]
+                        placeholders = ", ".join(["%s"] * len(chunk))
+                        cursor.execute(
+                            f"""UPDATE posts p
+                                SET p.comment_count = (
+                                    SELECT COUNT(*) FROM comments c WHERE c.post_id = p.id
+                                )
+                                WHERE p.id IN ({placeholders})""",
+                            chunk,
+                        )
+                conn.commit()
+        except Exception:
+            log.exception("Comment count flush error")
+            # Вернем посты, чтобы пересчитать их при следующем сбросе
+            with self._lock:
+                self._dirty |= dirty
+                self._stats["errors"] += 1
+            return
+
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["rows_written"] += len(dirty)
+
+        invalidate("posts", *(f"post:{post_id}" for post_id in post_ids))
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "pending_posts": len(self._dirty)}
+
+
+comment_counts = CounterBuffer(COMMENT_COUNT_FLUSH_MS, COMMENT_COUNT_FLUSH_EVENTS)
+atexit.register(comment_counts.flush)
+
+
+def reconcile(batch_size=RECONCILE_BATCH_SIZE):
+    # Пересчитывает comment_count по таблице comments, диапазонами id
+    fixed = 0
+    last_id = 0
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            while True:
+                cursor.execute(
+                    "SELECT MAX(id) AS max_id FROM (SELECT id FROM posts WHERE id > %s ORDER BY id LIMIT %s) t",
+                    (last_id, batch_size),
+                )
+                max_id = cursor.fetchone()["max_id"]
+                if max_id is None:
+                    break
+                # Сначала id разошедшихся постов: кроме ленты, их нужно сбросить
+                # в кэше поста (post:<id>) — и ETag, и post_cache
+                cursor.execute(
+                    """SELECT p.id FROM posts p
+                       LEFT JOIN (
+                           SELECT post_id, COUNT(*) AS total FROM comments
+                           WHERE post_id > %s AND post_id <= %s
+                           GROUP BY post_id
+                       ) c ON c.post_id = p.id
+                       WHERE p.id > %s AND p.id <= %s
+                         AND p.comment_count != COALESCE(c.total, 0)""",
+                    (last_id, max_id, last_id, max_id),
+                )
+                drifted = [row["id"] for row in cursor.fetchall()]
+                if drifted:
+                    placeholders = ", ".join(["%s"] * len(drifted))
+                    cursor.execute(
+                        f"""UPDATE posts p
+                            SET p.comment_count = (
+                                SELECT COUNT(*) FROM comments c WHERE c.post_id = p.id
+                            )
+                            WHERE p.id IN ({placeholders})""",
+                        drifted,
+                    )
+                    fixed += cursor.rowcount
+                conn.commit()
+                if drifted:
+                    invalidate("posts", *(f"post:{post_id}" for post_id in drifted))
+                last_id = max_id
+    return fixed
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["reconcile"]:
+        from app import application
+
+        with application.app_context():
+            print(f"Исправлено счетчиков: {reconcile()}")
+    else:
+        print(__doc__)
@@ -0,0 +1,253 @@
+"""Метрики запросов к MySQL и журнал медленных запросов.
+
+Каждый курсор из пула (db_pool.PooledConnection.cursor) оборачивается в
+InstrumentedCursor: время и число строк пишутся в гистограммы по
+нормализованному SQL. Метрики живут в памяти воркера, /metrics отдает
+данные того воркера, который обработал запрос. Поэтому у каждой серии есть
+метка pid: серии разных воркеров не перетирают друг друга, а перезапуск
+воркера выглядит как новая серия, а не как сброс счетчика. Суммировать
+по воркерам — sum without (pid) (rate(...)).
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from flask import g, has_request_context
+
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", 200))
+# Заголовки X-DB-Queries / X-DB-Time-Ms в ответах, для bench/routes.py
+DB_QUERY_HEADERS = os.getenv("DB_QUERY_HEADERS") == "1"
+MAX_STATEMENTS = 500
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+SECRET_COLUMN_RE = re.compile(r"password|token|secret|email", re.IGNORECASE)
+BCRYPT_RE = re.compile(r"^\$2[aby]?\$\d\d\$")
+
+slow_log = logging.getLogger("db.slow")
+
+_lock = threading.Lock()
+# Вызываются на каждый запрос к БД: listener(sql, params, seconds)
+query_listeners = []
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, label, value):
+        series = self.series.get(label)
+        if series is None:
+            series = self.series[label] = [[0] * len(self.buckets), 0, 0.0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += 1
+        series[2] += value
+
+
+query_duration = Histogram(DURATION_BUCKETS)
+acquire_duration = Histogram(DURATION_BUCKETS)
+request_queries = Histogram(COUNT_BUCKETS)
+query_rows = {}
+query_errors = {}
+
+
+def normalize_sql(sql):
+    sql = re.sub(r"\s+", " ", sql).strip()
+    sql = re.sub(r"'(?:[^'\\]|\\.)*'", "?", sql)
+    sql = re.sub(r"\b\d+\b", "?", sql)
+    sql = sql.replace("%s", "?")
+    # IN (?, ?, ?) и многострочные VALUES сводим к одной форме
+    sql = re.sub(r"\((?:\s*\?\s*,)+\s*\?\s*\)", "(?)", sql)
+    sql = re.sub(r"(VALUES \(\?\))(?:\s*,\s*\(\?\))+", r"\1", sql, flags=re.IGNORECASE)
+    return sql[:200]
+
+
+def _placeholder_columns(sql):
+    # Для каждого %s пытаемся понять, какой колонке он соответствует
+    insert = re.search(r"INSERT\s+INTO\s+\S+\s*\(([^)]*)\)", sql, re.IGNORECASE)
+    if insert and re.search(r"\bVALUES\b", sql, re.IGNORECASE):
+        return [column.strip().strip("`") for column in insert.group(1).split(",")]
+
+    columns = []
+    for match in re.finditer(r"(?:(\w+)\s*(?:=|!=|<=|>=|<|>|LIKE)\s*)?%s", sql, re.IGNORECASE):
+        columns.append(match.group(1))
+    return columns
+
+
+def redact_params(sql, params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _redact_value(key, value) for key, value in params.items()}
+    if not isinstance(params, (list, tuple)):
+        params = (params,)
+    columns = _placeholder_columns(sql)
+    return [
+        _redact_value(columns[i] if i < len(columns) else None, value)
+        for i, value in enumerate(params)
+    ]
+
+
+def _redact_value(column, value):
+    if column and SECRET_COLUMN_RE.search(column):
+        return "***"
+    if isinstance(value, str):
+        if BCRYPT_RE.match(value):
+            return "***"
+        if len(value) > 100:
+            return value[:100] + "…"
+    return value
+
+
+def _statement_label(sql):
+    label = normalize_sql(sql)
+    if label not in query_duration.series and len(query_duration.series) >= MAX_STATEMENTS:
+        return "other"
+    return label
+
+
+def record_query(sql, params, seconds, rows, error=None):
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+
+    with _lock:
+        label = _statement_label(sql)
+        query_duration.observe(label, seconds)
+        query_rows[label] = query_rows.get(label, 0) + max(rows, 0)
+        if error is not None:
+            query_errors[label] = query_errors.get(label, 0) + 1
+
+    for listener in query_listeners:
+        listener(sql, params, seconds)
+
+    if has_request_context():
+        g.db_queries = g.get("db_queries", 0) + 1
+        g.db_time = g.get("db_time", 0.0) + seconds
+
+    if seconds * 1000 >= DB_SLOW_QUERY_MS:
+        slow_log.warning(
+            "slow query %.1f ms rows=%s: %s params=%r",
+            seconds * 1000,
+            rows,
+            re.sub(r"\s+", " ", sql).strip(),
+            redact_params(sql, params),
+        )
+
+
+def record_acquire(seconds):
+    with _lock:
+        acquire_duration.observe("", seconds)
+
+
+def record_request(endpoint):
+    if not has_request_context():
+        return
+    with _lock:
+        request_queries.observe(endpoint or "unknown", g.get("db_queries", 0))
+
+
+def add_query_headers(response):
+    response.headers["X-DB-Queries"] = str(g.get("db_queries", 0))
+    response.headers["X-DB-Time-Ms"] = f"{g.get('db_time', 0.0) * 1000:.2f}"
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, connection=None, on_execute=None):
+        self._cursor = cursor
+        # cursor.connection.commit() в маршрутах должен идти через PooledConnection
+        self.connection = connection or cursor.connection
+        self._on_execute = on_execute
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._cursor.close()
+
+    def _timed(self, method, query, args):
+        if self._on_execute is not None:
+            self._on_execute()
+        started = time.perf_counter()
+        try:
+            result = method(query, args)
+        except Exception as e:
+            record_query(query, args, time.perf_counter() - started, 0, error=e)
+            raise
+        record_query(query, args, time.perf_counter() - started, self._cursor.rowcount)
+        return result
+
+    def execute(self, query, args=None):
+        return self._timed(self._cursor.execute, query, args)
+
+    def executemany(self, query, args):
+        return self._timed(self._cursor.executemany, query, args)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(name, help_text, histogram, label_name, pid_label):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for label, (counts, total, value_sum) in sorted(histogram.series.items()):
+        labels = pid_label + (f',{label_name}="{_escape(label)}"' if label_name else "")
+        for bound, count in zip(histogram.buckets, counts):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {value_sum}")
+        lines.append(f"{name}_count{{{labels}}} {total}")
+    return lines
+
+
+def render_metrics(pool_stats=None):
+    pid = f'pid="{os.getpid()}"'
+    with _lock:
+        lines = _histogram_lines(
+            "db_query_duration_seconds",
+            "Время выполнения запроса по нормализованному SQL",
+            query_duration,
+            "statement",
+            pid,
+        )
+        lines += ["# HELP db_query_rows_total Строк возвращено/изменено", "# TYPE db_query_rows_total counter"]
+        for label, rows in sorted(query_rows.items()):
+            lines.append(f'db_query_rows_total{{{pid},statement="{_escape(label)}"}} {rows}')
+        lines += ["# HELP db_query_errors_total Запросы с ошибкой", "# TYPE db_query_errors_total counter"]
+        for label, errors in sorted(query_errors.items()):
+            lines.append(f'db_query_errors_total{{{pid},statement="{_escape(label)}"}} {errors}')
+        lines += _histogram_lines(
+            "db_pool_acquire_duration_seconds",
+            "Время получения соединения из пула",
+            acquire_duration,
+            None,
+            pid,
+        )
+        lines += _histogram_lines(
+            "http_request_db_queries",
+            "Число запросов к БД на HTTP-запрос",
+            request_queries,
+            "endpoint",
+            pid,
+        )
+
+    if pool_stats:
+        lines += ["# HELP db_pool_stat Счетчики пула соединений", "# TYPE db_pool_stat gauge"]
+        for key, value in sorted(pool_stats.items()):
+            if isinstance(value, (int, float)) and key != "pid":
+                lines.append(f'db_pool_stat{{{pid},name="{key}"}} {value}')
+
+    lines.append(f"process_info{{{pid}}} 1")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,296 @@
+import threading
+import time
+import os
+import pymysql
+from pymysql.constants import SERVER_STATUS
+from db_metrics import InstrumentedCursor, record_acquire, record_query
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class PooledConnection:
+    # Обертка над соединением pymysql: close() возвращает соединение в пул,
+    # все остальные атрибуты проксируются на настоящее соединение
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+        # PyMySQL обновляет server_status только из OK-пакетов: после SELECT флаг
+        # IN_TRANS не выставлен, хотя InnoDB уже держит снимок. Поэтому сами
+        # отмечаем, что с последнего COMMIT/ROLLBACK выполнялись запросы
+        self._in_transaction = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._raw.cursor(*args, **kwargs), self, on_execute=self._mark_used)
+
+    def _mark_used(self):
+        self._in_transaction = True
+
+    def _timed(self, statement, method):
+        # COMMIT/ROLLBACK — такие же обращения к базе, их тоже считаем
+        started = time.perf_counter()
+        try:
+            method()
+        except Exception as e:
+            record_query(statement, None, time.perf_counter() - started, 0, error=e)
+            raise
+        record_query(statement, None, time.perf_counter() - started, 0)
+        self._in_transaction = False
+
+    def commit(self):
+        self._timed("COMMIT", self._raw.commit)
+
+    def rollback(self):
+        self._timed("ROLLBACK", self._raw.rollback)
+
+    @property
+    def open(self):
+        return not self._released and self._raw.open
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self._raw, self._created_at, self._in_transaction)
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connect_kwargs,
+        min_size=1,
+        max_size=10,
+        timeout=5.0,
+        idle_timeout=300.0,
+        max_lifetime=3600.0,
+    ):
+        self.connect_kwargs = connect_kwargs
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition(threading.Lock())
+        self._reset_state()
+
+    def _reset_state(self):
+        self._pid = os.getpid()
+        # (соединение, время создания, время возврата в пул)
+        self._idle = []
+        self._size = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "misses": 0,
+            "timeouts": 0,
+            "created": 0,
+            "recycled_idle": 0,
+            "recycled_lifetime": 0,
+            "ping_failures": 0,
+        }
+
+    def _check_fork(self):
+        # После fork() (gunicorn) сокеты родителя использовать нельзя
+        if self._pid != os.getpid():
+            self._reset_state()
+
+    def _connect(self):
+        raw = pymysql.connect(**self.connect_kwargs)
+        with self._cond:
+            self._stats["created"] += 1
+        return raw, time.monotonic()
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _expired(self, created_at, returned_at, now):
+        if self.max_lifetime and now - created_at > self.max_lifetime:
+            self._stats["recycled_lifetime"] += 1
+            return True
+        # Простаивающие соединения закрываем, только пока пул больше min_size
+        if (
+            self.idle_timeout
+            and self._size > self.min_size
+            and now - returned_at > self.idle_timeout
+        ):
+            self._stats["recycled_idle"] += 1
+            return True
+        return False
+
+    def _reap(self):
+        # Вызывается под блокировкой: выкидывает из пула все протухшие соединения,
+        # а не только верхнее — до дна стека LIFO очередь доходит редко.
+        # Закрывать возвращенные соединения нужно уже без блокировки
+        now = time.monotonic()
+        expired, kept = [], []
+        for entry in self._idle:
+            raw, created_at, returned_at = entry
+            if self._expired(created_at, returned_at, now):
+                self._size -= 1
+                expired.append(raw)
+            else:
+                kept.append(entry)
+        self._idle = kept
+        return expired
+
+    def acquire(self):
+        started = time.perf_counter()
+        connection = self._acquire()
+        record_acquire(time.perf_counter() - started)
+        return connection
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        wait_started = None
+        item = None
+        timed_out = False
+
+        with self._cond:
+            self._check_fork()
+            self._stats["checkouts"] += 1
+            expired = self._reap()
+
+            while True:
+                if self._idle:
+                    raw, created_at, _ = self._idle.pop()
+                    item = raw, created_at
+                    break
+
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._stats["misses"] += 1
+                    break
+
+                if not waited:
+                    waited = True
+                    wait_started = time.monotonic()
+                    self._stats["waits"] += 1
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    self._stats["wait_time"] += time.monotonic() - wait_started
+                    timed_out = True
+                    break
+                self._cond.wait(remaining)
+
+            if waited and not timed_out:
+                self._stats["wait_time"] += time.monotonic() - wait_started
+
+        for raw in expired:
+            self._discard(raw)
+        if timed_out:
+            raise PoolTimeoutError("Нет свободных соединений с базой данных")
+
+        if item is not None:
+            raw, created_at = item
+            try:
+                # Без reconnect: переподключение внутри ping не попало бы в статистику
+                # и оставило бы старое created_at, max_lifetime перестал бы работать
+                raw.ping(reconnect=False)
+                return PooledConnection(self, raw, created_at)
+            except Exception:
+                with self._cond:
+                    self._stats["ping_failures"] += 1
+                self._discard(raw)
+                # Слот остается за нами, вместо мертвого соединения открываем новое
+
+        try:
+            raw, created_at = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw, created_at)
+
+    def _release(self, raw, created_at, in_transaction=True):
+        healthy = raw.open
+        if healthy and (in_transaction or raw.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS):
+            # Незакоммиченные изменения и снимок чтения не должны попасть
+            # в следующий запрос. Без открытой транзакции ROLLBACK не шлем
+            started = time.perf_counter()
+            try:
+                raw.rollback()
+            except Exception as e:
+                record_query("ROLLBACK", None, time.perf_counter() - started, 0, error=e)
+                healthy = False
+            else:
+                record_query("ROLLBACK", None, time.perf_counter() - started, 0)
+
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            if healthy and time.monotonic() - created_at <= self.max_lifetime:
+                self._idle.append((raw, created_at, time.monotonic()))
+                raw = None
+            else:
+                self._size -= 1
+            expired = self._reap()
+            # Выкинутые соединения освободили слоты — будим и тех, кто ждет их
+            self._cond.notify(1 + len(expired))
+
+        if raw is not None:
+            self._discard(raw)
+        for raw in expired:
+            self._discard(raw)
+
+    def fill(self):
+        # Прогреваем пул до min_size
+        while True:
+            with self._cond:
+                self._check_fork()
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                raw, created_at = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((raw, created_at, time.monotonic()))
+                self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for raw, _, _ in idle:
+            self._discard(raw)
+
+    def stats(self):
+        with self._cond:
+            self._check_fork()
+            stats = dict(self._stats)
+            stats["wait_time"] = round(stats["wait_time"], 6)
+            stats.update(
+                {
+                    "size": self._size,
+                    "idle": len(self._idle),
+                    "in_use": self._size - len(self._idle),
+                    "min_size": self.min_size,
+                    "max_size": self.max_size,
+                    "pid": self._pid,
+                }
+            )
+            return stats
@@ -0,0 +1,174 @@
+"""EXPLAIN-проверка: ни один запрос маршрутов не читает таблицу целиком.
+
+Прогоняет основные маршруты через test_client, перехватывает все запросы
+к БД (db_metrics.query_listeners) и выполняет для каждого EXPLAIN с теми же
+параметрами. На маленькой таблице MySQL выбирает полный проход даже при
+наличии индекса, поэтому нужна засеянная база:
+
+    python migrate.py up
+    python bench/routes.py seed
+    python explain_check.py
+
+Маршруты записи тоже вызываются (комментарий добавляется и удаляется, пост
+правится теми же данными), так что запускать только на тестовой базе.
+Код выхода 1, если нашелся полный проход (type = ALL).
+"""
+
+import os
+import sys
+import time
+import traceback
+from pathlib import Path
+
+# Кэш отключается до импорта app: иначе часть запросов не дойдет до базы
+os.environ["CACHE_TYPE"] = "NullCache"
+
+import jwt
+from app import application
+from config import SECRET_KEY, get_db_connection
+from counters import comment_counts
+from db_metrics import normalize_sql, query_listeners
+
+ROOT = Path(__file__).resolve().parent
+MIN_ROWS = 1000
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+
+
+def query_source():
+    # Первый кадр стека из кода проекта, кроме самой инструментации
+    for frame in reversed(traceback.extract_stack()):
+        path = Path(frame.filename)
+        if ROOT in path.parents and path.name not in ("db_metrics.py", "db_pool.py", "explain_check.py"):
+            return f"{path.relative_to(ROOT)}:{frame.lineno}"
+    return "?"
+
+
+def make_token(user_id):
+    now = int(time.time())
+    return jwt.encode({"sub": str(user_id), "iat": now, "exp": now + 600}, SECRET_KEY, algorithm="HS256")
+
+
+def load_fixture():
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS n FROM posts")
+            posts = cursor.fetchone()["n"]
+            cursor.execute("SELECT COUNT(*) AS n FROM comments")
+            comments = cursor.fetchone()["n"]
+            if posts < MIN_ROWS or comments < MIN_ROWS:
+                sys.exit(
+                    f"Слишком мало данных ({posts} постов, {comments} комментариев), "
+                    "сначала python bench/routes.py seed"
+                )
+            cursor.execute(
+                """SELECT p.id, p.title, p.content, p.author_id, u.email, u.nickname
+                   FROM posts p JOIN users u ON u.id = p.author_id
+                   ORDER BY p.comment_count DESC LIMIT 1"""
+            )
+            return cursor.fetchone()
+
+
+def exercise(client, post):
+    post_id, author_id = post["id"], post["author_id"]
+    auth = {"Authorization": f"Bearer {make_token(author_id)}"}
+    admin = {"Authorization": f"Bearer {make_token(1)}"}
+    word = post["title"].split()[0]
+    responses = []
+
+    def call(method, path, **kwargs):
+        response = client.open(path, method=method, **kwargs)
+        responses.append((method, path, response.status_code))
+        return response
+
+    first_page = call("GET", "/posts?limit=5").get_json() or {}
+    if first_page.get("next_cursor"):
+        call("GET", f"/posts?limit=5&cursor={first_page['next_cursor']}")
+    call("GET", "/posts?fields=summary")
+    call("GET", f"/posts/{post_id}")
+    call("GET", f"/posts/{post_id}/comments")
+    call("GET", f"/posts/{post_id}/comments/tree")
+    call("GET", f"/profile/{author_id}")
+    call("GET", f"/profile/{author_id}", headers=auth)
+    call("GET", f"/search?q={word}")
+    call("GET", f"/search?q={word}&type=comments")
+    call("POST", "/login", json={"email": post["email"], "password": "explain-check"})
+    call("POST", "/register", json={"email": post["email"], "password": "x", "nickname": "x"})
+
+    call(
+        "PATCH",
+        f"/posts/{post_id}",
+        headers=auth,
+        json={"author_id": author_id, "title": post["title"], "content": post["content"]},
+    )
+    created = call(
+        "POST",
+        f"/posts/{post_id}/comments",
+        headers=auth,
+        json={"post_id": post_id, "user_id": author_id, "content": "explain check comment"},
+    ).get_json() or {}
+    comment = created.get("comment") or created.get("commentsReplies")
+    if comment:
+        call("DELETE", f"/comments/{comment['id']}", headers=auth)
+    call("PATCH", f"/profile/{author_id}", headers=auth, json={"nickname": post["nickname"]})
+    for _ in range(2):
+        call("PATCH", f"/posts/option/{post_id}", headers=admin, json={"option": "is_pinned"})
+    comment_counts.flush()
+    return responses
+
+
+def explain(statements):
+    problems = []
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for label, (sql, params, source) in sorted(statements.items()):
+                try:
+                    cursor.execute(f"EXPLAIN {sql}", params)
+                    plan = cursor.fetchall()
+                except Exception as e:
+                    print(f"? {source}: EXPLAIN не выполнился ({e})\n  {label}")
+                    continue
+                # <derived2>, <union1,2> — временные таблицы, их проход не в счет;
+                # строка INSERT — таблица, в которую пишут, а не читают
+                scans = [
+                    row["table"]
+                    for row in plan
+                    if row["type"] == "ALL"
+                    and row["select_type"] != "INSERT"
+                    and not str(row["table"]).startswith("<")
+                ]
+                mark = "FULL SCAN " + ", ".join(scans) if scans else "ok"
+                print(f"{mark:<24} {source}\n  {label}")
+                if scans:
+                    problems.append(label)
+    return problems
+
+
+def main():
+    post = load_fixture()
+    statements = {}
+
+    def capture(sql, params, seconds):
+        label = normalize_sql(sql)
+        if not label.upper().startswith(EXPLAINABLE):
+            return
+        if params and isinstance(params, list) and isinstance(params[0], (tuple, list)):
+            params = params[0]  # executemany: плана достаточно для первой строки
+        statements.setdefault(label, (sql, params, query_source()))
+
+    query_listeners.append(capture)
+    try:
+        responses = exercise(application.test_client(), post)
+    finally:
+        query_listeners.remove(capture)
+
+    for method, path, status in responses:
+        if status >= 500:
+            print(f"Внимание: {method} {path} ответил {status}, его запросы могли не попасть в проверку")
+
+    problems = explain(statements)
+    print(f"\nЗапросов проверено: {len(statements)}, с полным проходом: {len(problems)}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
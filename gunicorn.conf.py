@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+
+# Режимы работы (GUNICORN_WORKER_CLASS):
+#   sync    — как раньше: один запрос на воркер, конкурентность = workers
+#   gthread — по умолчанию: потоки внутри воркера, PyMySQL и bcrypt отпускают GIL
+#             на сетевом вводе-выводе и хешировании
+#   gevent  — зеленые потоки, нужен `pip install gevent`; PyMySQL написан на чистом
+#             Python и работает поверх пропатченных сокетов
+#
+# Подбор размеров:
+#   workers            = 2 * CPU + 1
+#   threads (gthread)  = 1 / (1 - доля времени запроса в ожидании БД), обычно 4-8
+#   DB_POOL_MAX_SIZE   = threads для gthread, 10-20 для gevent (лишние ждут в пуле)
+#   workers * DB_POOL_MAX_SIZE <= max_connections MySQL минус запас под админку
+#   BCRYPT_HOST_SLOTS  = одновременных хеширований bcrypt на весь хост (hashing.py),
+#                        по умолчанию CPU - 1: bcrypt занимает ядро целиком, одно
+#                        ядро остается запросам. Семафор создается в мастере и
+#                        общий для всех воркеров
+#   BCRYPT_WORKERS     = предел пула процессов bcrypt в одном воркере, по умолчанию
+#                        BCRYPT_HOST_SLOTS; процессы создаются по мере нужды, а
+#                        одновременно на хосте хешируют не больше BCRYPT_HOST_SLOTS
+#
+# Сравнение режимов: python bench/serving.py --help
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", 4 if worker_class == "gthread" else 1))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 200))
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:3001")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+if worker_class == "gevent":
+    default_pool_size = min(worker_connections, 20)
+else:
+    default_pool_size = threads
+
+# Пул соединений (config.py) должен покрывать все потоки воркера
+os.environ.setdefault("DB_POOL_MAX_SIZE", str(default_pool_size))
+os.environ.setdefault("BCRYPT_HOST_SLOTS", str(max(1, multiprocessing.cpu_count() - 1)))
+os.environ.setdefault("BCRYPT_WORKERS", os.environ["BCRYPT_HOST_SLOTS"])
+
+
+def on_starting(server):
+    # До fork воркеров: семафор наследуется, а не создается в каждом воркере
+    import hashing
+
+    hashing.share_host_slots()
+
+
+def post_worker_init(worker):
+    # Соединения до min_size открываем до первого запроса, а не на нем
+    from config import db_pool
+
+    try:
+        db_pool.fill()
+    except Exception as e:
+        worker.log.warning("Не удалось прогреть пул соединений: %s", e)
+
+
+def worker_exit(server, worker):
+    from config import db_pool
+
+    db_pool.close_all()
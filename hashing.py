@@ -0,0 +1,107 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Процессов в пуле одного воркера gunicorn; процессы создаются по мере нужды
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", 2))
+# Одновременных хеширований на весь хост, общий семафор для всех воркеров
+# (gunicorn.conf.py). 0 — без общего ограничения
+BCRYPT_HOST_SLOTS = int(os.getenv("BCRYPT_HOST_SLOTS", 0))
+# Сколько хеширований на воркер может ждать очереди, остальным сразу 503
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", 8))
+BCRYPT_TIMEOUT = float(os.getenv("BCRYPT_TIMEOUT", 10))
+
+
+class HashingBusyError(Exception):
+    pass
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password, password_hash):
+    return bcrypt.checkpw(password, password_hash)
+
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_slots = threading.BoundedSemaphore(BCRYPT_MAX_PENDING)
+_host_slots = None
+
+
+def share_host_slots(slots=BCRYPT_HOST_SLOTS):
+    # Вызывается в мастере gunicorn до fork воркеров: семафор наследуют все
+    # воркеры, и bcrypt на хосте занимает не больше slots ядер. Слот воркера,
+    # убитого посреди хеширования, не возвращается до перезапуска мастера
+    global _host_slots
+    if slots > 0:
+        _host_slots = multiprocessing.get_context("fork").BoundedSemaphore(slots)
+
+
+def _mp_context():
+    # fork из многопоточного воркера (gthread) копирует чужие захваченные
+    # блокировки, и процесс пула может зависнуть. forkserver запускает
+    # процессы из чистого однопоточного сервера
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _lock:
+        # Пул процессов создается лениво в каждом воркере gunicorn
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=BCRYPT_WORKERS, mp_context=_mp_context())
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _release_slots():
+    if _host_slots is not None:
+        _host_slots.release()
+    _slots.release()
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HashingBusyError("Сервер перегружен, попробуйте позже")
+    deadline = time.monotonic() + BCRYPT_TIMEOUT
+    if _host_slots is not None and not _host_slots.acquire(timeout=BCRYPT_TIMEOUT):
+        _slots.release()
+        raise HashingBusyError("Сервер перегружен, попробуйте позже")
+    try:
+        future = _get_executor().submit(fn, *args)
+    except Exception:
+        _release_slots()
+        raise
+    # Слоты освобождаются, когда хеширование действительно закончилось:
+    # после таймаута задача еще занимает процесс пула
+    future.add_done_callback(lambda _: _release_slots())
+    try:
+        return future.result(timeout=max(0, deadline - time.monotonic()))
+    except TimeoutError:
+        future.cancel()
+        raise HashingBusyError("Сервер перегружен, попробуйте позже")
+
+
+def hash_password(password):
+    return _run(_hashpw, password.encode("utf-8"), BCRYPT_ROUNDS).decode("utf-8")
+
+
+def check_password(password, password_hash):
+    return _run(_checkpw, password.encode("utf-8"), password_hash.encode("utf-8"))
+
+
+def needs_rehash(password_hash):
+    # Формат: $2b$12$<соль+хеш>
+    try:
+        return int(password_hash.split("$")[2]) < BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
@@ -0,0 +1,119 @@
+import hashlib
+import io
+import json
+import os
+from PIL import Image, ImageOps, features
+
+# Наибольшая сторона варианта; от большего к меньшему, каждый следующий
+# уменьшается из предыдущего, так что исходник декодируется один раз
+VARIANTS = {"full": 1920, "feed": 960, "thumb": 320}
+VARIANTS_FOLDER = "uploads/variants"
+IMAGE_FORMATS = [
+    fmt
+    for fmt in os.getenv("IMAGE_FORMATS", "webp").split(",")
+    if fmt and features.check(fmt)
+]
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 80))
+
+os.makedirs(VARIANTS_FOLDER, exist_ok=True)
+
+
+def manifest_path(path):
+    return f"{path}.variants.json"
+
+
+def _save_variant(image, fmt):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), quality=IMAGE_QUALITY)
+    data = buffer.getvalue()
+
+    # Имя файла — хеш содержимого, одинаковые варианты не дублируются
+    filename = f"{hashlib.sha256(data).hexdigest()[:32]}.{fmt}"
+    target = os.path.join(VARIANTS_FOLDER, filename)
+    if not os.path.exists(target):
+        tmp = f"{target}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, target)
+
+    return {
+        "file": filename,
+        "format": fmt,
+        "width": image.width,
+        "height": image.height,
+        "bytes": len(data),
+    }
+
+
+def process_image(path):
+    with Image.open(path) as source:
+        manifest = {
+            "original": {
+                "width": source.width,
+                "height": source.height,
+                "format": (source.format or "").lower(),
+            },
+            "variants": {},
+        }
+
+        # Анимированные GIF пока отдаем как есть
+        if getattr(source, "n_frames", 1) > 1 or not IMAGE_FORMATS:
+            image = None
+        else:
+            image = ImageOps.exif_transpose(source)
+            image.load()
+
+    if image is not None:
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        for name, size in VARIANTS.items():
+            if max(image.size) > size:
+                image = image.resize(_fit(image.size, size), Image.LANCZOS)
+            manifest["variants"][name] = {
+                fmt: _save_variant(image, fmt) for fmt in IMAGE_FORMATS
+            }
+
+    with open(manifest_path(path), "w") as f:
+        json.dump(manifest, f)
+
+    return manifest
+
+
+def _fit(size, limit):
+    width, height = size
+    scale = limit / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def load_manifest(path):
+    try:
+        with open(manifest_path(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def variant_files(manifest):
+    return {info["file"] for formats in manifest["variants"].values() for info in formats.values()}
+
+
+def pick_variant(manifest, variant, fmt=None):
+    if not manifest:
+        return None
+    formats = manifest["variants"].get(variant)
+    if not formats:
+        return None
+    if fmt in formats:
+        return formats[fmt]
+    return next(iter(formats.values()))
+
+
+def variant_urls(manifest, base_url):
+    return {
+        name: {
+            fmt: f"{base_url}/uploads/variants/{info['file']}"
+            for fmt, info in formats.items()
+        }
+        for name, formats in manifest["variants"].items()
+    }
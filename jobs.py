@@ -0,0 +1,227 @@
+"""Очередь фоновых задач на SQLite (обработка загруженных картинок и т.п.).
+
+Воркеры запускаются отдельно от gunicorn:
+
+    python jobs.py --workers 2
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "data/jobs.sqlite3")
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", 5))
+# Задача, которую воркер держит дольше этого времени, считается брошенной
+JOBS_LOCK_TIMEOUT = float(os.getenv("JOBS_LOCK_TIMEOUT", 300))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", 0.5))
+# Для локальной разработки без отдельного воркера
+JOBS_INLINE = os.getenv("JOBS_INLINE", "0") == "1"
+
+HANDLERS = {}
+
+log = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def handler(kind):
+    def decorator(f):
+        HANDLERS[kind] = f
+        return f
+
+    return decorator
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        os.makedirs(os.path.dirname(JOBS_DB_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(JOBS_DB_PATH, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                run_after REAL NOT NULL,
+                locked_by TEXT,
+                locked_at REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after)"
+        )
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def enqueue(kind, payload, max_attempts=JOBS_MAX_ATTEMPTS):
+    now = time.time()
+    cur = _connect().execute(
+        """INSERT INTO jobs (kind, payload, max_attempts, run_after, created_at, updated_at)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (kind, json.dumps(payload), max_attempts, now, now, now),
+    )
+    job_id = cur.lastrowid
+    if JOBS_INLINE:
+        job = claim(job_id=job_id)
+        if job is not None:
+            run_job(job)
+    return job_id
+
+
+def get_job(job_id):
+    row = _connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    return {
+        "id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+    }
+
+
+def claim(worker_id=None, job_id=None):
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    conn = _connect()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if job_id is not None:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE id = ? AND status = 'queued'", (job_id,)
+            ).fetchone()
+        else:
+            row = conn.execute(
+                """SELECT * FROM jobs
+                   WHERE (status = 'queued' AND run_after <= ?)
+                      OR (status = 'running' AND locked_at < ?)
+                   ORDER BY run_after, id
+                   LIMIT 1""",
+                (now, now - JOBS_LOCK_TIMEOUT),
+            ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        conn.execute(
+            """UPDATE jobs
+               SET status = 'running', attempts = attempts + 1,
+                   locked_by = ?, locked_at = ?, updated_at = ?
+               WHERE id = ?""",
+            (worker_id, now, now, row["id"]),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return dict(row, attempts=row["attempts"] + 1, locked_by=worker_id, locked_at=now)
+
+
+def _finish(conn, job, sql, params):
+    # Пишем результат, только если задача все еще наша: после JOBS_LOCK_TIMEOUT
+    # ее мог забрать другой воркер, и его статус затирать нельзя
+    cur = conn.execute(
+        f"{sql} WHERE id = ? AND locked_by = ? AND locked_at = ?",
+        (*params, job["id"], job["locked_by"], job["locked_at"]),
+    )
+    if cur.rowcount == 0:
+        log.warning("Задача %s уже не принадлежит воркеру %s, результат отброшен", job["id"], job["locked_by"])
+        return False
+    return True
+
+
+def run_job(job):
+    conn = _connect()
+    try:
+        result = HANDLERS[job["kind"]](**json.loads(job["payload"]))
+    except Exception as e:
+        now = time.time()
+        error = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+        if job["attempts"] >= job["max_attempts"]:
+            _finish(
+                conn,
+                job,
+                "UPDATE jobs SET status = 'failed', error = ?, locked_by = NULL, updated_at = ?",
+                (error, now),
+            )
+        else:
+            # Экспоненциальная пауза между попытками: 2, 4, 8... секунд
+            _finish(
+                conn,
+                job,
+                """UPDATE jobs SET status = 'queued', error = ?, locked_by = NULL,
+                   run_after = ?, updated_at = ?""",
+                (error, now + 2 ** job["attempts"], now),
+            )
+        return False
+
+    return _finish(
+        conn,
+        job,
+        """UPDATE jobs SET status = 'done', result = ?, error = NULL, locked_by = NULL,
+           updated_at = ?""",
+        (json.dumps(result), time.time()),
+    )
+
+
+@handler("process_image")
+def process_image_job(path, base_url):
+    from images import process_image, variant_urls
+
+    return {"variants": variant_urls(process_image(path), base_url)}
+
+
+def work(stop_event=None):
+    stop_event = stop_event or multiprocessing.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    while not stop_event.is_set():
+        job = claim()
+        if job is None:
+            stop_event.wait(JOBS_POLL_INTERVAL)
+            continue
+        run_job(job)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркеры фоновых задач")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("JOBS_WORKERS", 2)))
+    args = parser.parse_args()
+
+    stop_event = multiprocessing.Event()
+    processes = [
+        multiprocessing.Process(target=work, args=(stop_event,))
+        for _ in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
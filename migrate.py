@@ -0,0 +1,156 @@
+"""Версионные миграции схемы из migrations/NNN_*.sql.
+
+Примененные версии записываются в таблицу schema_migrations:
+
+    python migrate.py status          # что применено, что ждет
+    python migrate.py up              # применить ожидающие по порядку
+    python migrate.py baseline 006    # отметить 000..006 примененными, не выполняя
+                                      # (база, которую раньше мигрировали руками)
+
+DDL в MySQL не транзакционный: если файл упал посередине, уже выполненные
+выражения остаются, версия не записывается. Такой файл нужно довести руками
+и отметить через baseline.
+"""
+
+import hashlib
+import re
+import sys
+from pathlib import Path
+from config import get_db_connection
+
+MIGRATIONS_FOLDER = Path(__file__).resolve().parent / "migrations"
+MIGRATION_RE = re.compile(r"^(\d{3})_[\w-]+\.sql$")
+# Два процесса (например, два контейнера при деплое) не должны мигрировать одновременно
+LOCK_NAME = "blog_schema_migrations"
+LOCK_TIMEOUT = 60
+
+
+class MigrationError(Exception):
+    pass
+
+
+def load_migrations():
+    migrations = []
+    for path in sorted(MIGRATIONS_FOLDER.glob("*.sql")):
+        match = MIGRATION_RE.match(path.name)
+        if not match:
+            continue
+        sql = path.read_text(encoding="utf-8")
+        migrations.append(
+            {
+                "version": match.group(1),
+                "name": path.name,
+                "sql": sql,
+                "checksum": hashlib.sha256(sql.encode("utf-8")).hexdigest(),
+            }
+        )
+
+    versions = [m["version"] for m in migrations]
+    duplicates = {v for v in versions if versions.count(v) > 1}
+    if duplicates:
+        raise MigrationError(f"Несколько миграций с одной версией: {', '.join(sorted(duplicates))}")
+    return migrations
+
+
+def split_statements(sql):
+    sql = "\n".join(line for line in sql.splitlines() if not line.strip().startswith("--"))
+    return [statement.strip() for statement in re.split(r";\s*(?:\n|$)", sql) if statement.strip()]
+
+
+def ensure_table(cursor):
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS schema_migrations (
+               version CHAR(3) NOT NULL PRIMARY KEY,
+               name VARCHAR(255) NOT NULL,
+               checksum CHAR(64) NOT NULL,
+               applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+           )"""
+    )
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version, name, checksum, applied_at FROM schema_migrations")
+    return {row["version"]: row for row in cursor.fetchall()}
+
+
+def record(cursor, migration):
+    cursor.execute(
+        "INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+        (migration["version"], migration["name"], migration["checksum"]),
+    )
+
+
+def status():
+    migrations = load_migrations()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            ensure_table(cursor)
+            applied = applied_versions(cursor)
+
+    result = []
+    for migration in migrations:
+        row = applied.get(migration["version"])
+        if row is None:
+            state = "pending"
+        elif row["checksum"] != migration["checksum"]:
+            # Файл поменяли после применения — на других базах он мог выполниться иначе
+            state = "changed"
+        else:
+            state = "applied"
+        result.append({"name": migration["name"], "state": state})
+    return result
+
+
+def migrate(target=None, baseline=False):
+    migrations = load_migrations()
+    done = []
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT GET_LOCK(%s, %s) AS locked", (LOCK_NAME, LOCK_TIMEOUT))
+            if not cursor.fetchone()["locked"]:
+                raise MigrationError("Миграции уже выполняет другой процесс")
+            try:
+                ensure_table(cursor)
+                applied = applied_versions(cursor)
+                for migration in migrations:
+                    if target is not None and migration["version"] > target:
+                        break
+                    if migration["version"] in applied:
+                        continue
+                    if not baseline:
+                        for statement in split_statements(migration["sql"]):
+                            try:
+                                cursor.execute(statement)
+                            except Exception as e:
+                                raise MigrationError(f"{migration['name']}: {e}") from e
+                    record(cursor, migration)
+                    conn.commit()
+                    done.append(migration["name"])
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+    return done
+
+
+def main(argv):
+    command = argv[0] if argv else None
+    try:
+        if command == "status":
+            for row in status():
+                print(f"{row['state']:<8} {row['name']}")
+        elif command == "up":
+            done = migrate()
+            print("\n".join(f"Применена {name}" for name in done) or "Новых миграций нет")
+        elif command == "baseline" and len(argv) == 2:
+            done = migrate(target=argv[1].zfill(3), baseline=True)
+            print(f"Отмечено примененными: {len(done)}")
+        else:
+            print(__doc__)
+            return 1
+    except MigrationError as e:
+        print(f"Ошибка миграции: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,35 @@
+-- Исходная схема, от которой отсчитываются остальные миграции. На уже
+-- существующей базе ничего не меняет (IF NOT EXISTS); такую базу отмечают
+-- как мигрированную: python migrate.py baseline 006
+CREATE TABLE IF NOT EXISTS users (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    email VARCHAR(255) NOT NULL,
+    password_hash VARCHAR(255) NOT NULL,
+    nickname VARCHAR(100) NOT NULL,
+    bio TEXT NULL,
+    banner_url VARCHAR(255) NULL,
+    status VARCHAR(255) NULL,
+    is_active TINYINT(1) NOT NULL DEFAULT 1,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS posts (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    content MEDIUMTEXT NOT NULL,
+    author_id INT NOT NULL,
+    is_pinned TINYINT(1) NOT NULL DEFAULT 0,
+    is_ad TINYINT(1) NOT NULL DEFAULT 0,
+    comment_count INT UNSIGNED NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NULL
+) DEFAULT CHARSET = utf8mb4;
+
+CREATE TABLE IF NOT EXISTS comments (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    post_id INT NOT NULL,
+    user_id INT NOT NULL,
+    content TEXT NOT NULL,
+    parent_id INT NULL,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+) DEFAULT CHARSET = utf8mb4;
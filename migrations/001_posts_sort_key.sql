@@ -0,0 +1,6 @@
+-- Ключ сортировки ленты: COALESCE(updated_at, created_at) не может использовать индекс,
+-- поэтому храним его в STORED-колонке и строим составной индекс для keyset-пагинации
+ALTER TABLE posts
+    ADD COLUMN sort_at DATETIME AS (COALESCE(updated_at, created_at)) STORED;
+
+CREATE INDEX idx_posts_sort_at_id ON posts (sort_at, id);
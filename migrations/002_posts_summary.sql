@@ -0,0 +1,11 @@
+-- Тизер для ленты (GET /posts?fields=summary), заполняется в new_post/upd_post
+ALTER TABLE posts
+    ADD COLUMN excerpt VARCHAR(400) NOT NULL DEFAULT '',
+    ADD COLUMN word_count INT UNSIGNED NOT NULL DEFAULT 0,
+    ADD COLUMN reading_time SMALLINT UNSIGNED NOT NULL DEFAULT 1;
+
+-- Приблизительное заполнение для уже существующих постов
+UPDATE posts
+SET excerpt = LEFT(TRIM(REGEXP_REPLACE(content, '<[^>]+>', ' ')), 300),
+    word_count = LENGTH(TRIM(content)) - LENGTH(REPLACE(TRIM(content), ' ', '')) + 1,
+    reading_time = GREATEST(1, CEIL((LENGTH(TRIM(content)) - LENGTH(REPLACE(TRIM(content), ' ', '')) + 1) / 200));
@@ -0,0 +1,2 @@
+-- Дерево комментариев: выборка веток и рекурсивный обход ответов
+CREATE INDEX idx_comments_post_parent_created ON comments (post_id, parent_id, created_at);
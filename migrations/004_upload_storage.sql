@@ -0,0 +1,21 @@
+-- Контентно-адресуемое хранилище загрузок (storage.py)
+CREATE TABLE upload_blobs (
+    sha256 CHAR(64) NOT NULL PRIMARY KEY,
+    ext VARCHAR(8) NOT NULL,
+    size INT UNSIGNED NOT NULL,
+    mimetype VARCHAR(64) NOT NULL,
+    ref_count INT UNSIGNED NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_upload_blobs_ref_count (ref_count)
+);
+
+CREATE TABLE uploads (
+    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    sha256 CHAR(64) NOT NULL,
+    user_id INT NULL,
+    kind VARCHAR(16) NOT NULL,
+    original_name VARCHAR(255) NOT NULL DEFAULT '',
+    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_uploads_sha256 (sha256),
+    KEY idx_uploads_user_id (user_id)
+);
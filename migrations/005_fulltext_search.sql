@@ -0,0 +1,7 @@
+-- Полнотекстовый поиск (GET /search). search_text — текст, приведенный к основам
+-- слов в search_index.py; после миграции: python search_index.py reindex
+ALTER TABLE posts ADD COLUMN search_text MEDIUMTEXT NULL;
+ALTER TABLE comments ADD COLUMN search_text TEXT NULL;
+
+CREATE FULLTEXT INDEX ft_posts_search_text ON posts (search_text);
+CREATE FULLTEXT INDEX ft_comments_search_text ON comments (search_text);
@@ -0,0 +1,11 @@
+-- Ник автора хранится рядом с постом/комментарием: лента и комментарии
+-- читаются без JOIN с users. При смене ника его обновляет updateUser
+ALTER TABLE posts ADD COLUMN author_nickname VARCHAR(100) NOT NULL DEFAULT '';
+ALTER TABLE comments ADD COLUMN author_nickname VARCHAR(100) NOT NULL DEFAULT '';
+
+UPDATE posts p JOIN users u ON p.author_id = u.id SET p.author_nickname = u.nickname;
+UPDATE comments c JOIN users u ON c.user_id = u.id SET c.author_nickname = u.nickname;
+
+-- Для обновления ника по автору
+CREATE INDEX idx_posts_author_id_id ON posts (author_id, id);
+CREATE INDEX idx_comments_user_id ON comments (user_id);
@@ -0,0 +1,5 @@
+-- login/register ищут пользователя по email; уникальный индекс заодно
+-- не дает двум одновременным регистрациям создать дубликат.
+-- Если миграция падает на дубликатах, их нужно сначала разобрать:
+--   SELECT email, COUNT(*) FROM users GROUP BY email HAVING COUNT(*) > 1;
+CREATE UNIQUE INDEX idx_users_email ON users (email);
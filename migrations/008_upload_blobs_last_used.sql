@@ -0,0 +1,8 @@
+-- Сборщик мусора не трогает объекты, загруженные недавно: на них еще
+-- не успел сослаться пост или баннер (storage.UPLOAD_GC_GRACE).
+-- Счетчики, набранные раньше самими загрузками, завышены: такие объекты
+-- просто не будут собраны, живые файлы не пострадают
+ALTER TABLE upload_blobs
+    ADD COLUMN last_used_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP KEY idx_upload_blobs_ref_count,
+    ADD KEY idx_upload_blobs_gc (ref_count, last_used_at);
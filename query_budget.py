@@ -0,0 +1,114 @@
+"""Бюджет обращений к БД на HTTP-запрос и поиск N+1.
+
+Маршрут объявляет бюджет декоратором @query_budget(n): сколько обращений
+к базе (запросы, COMMIT, ROLLBACK) ему положено; ROLLBACK, которым пул
+закрывает транзакцию чтения при возврате соединения, тоже в счет. После ответа трекер
+сравнивает фактическое число с бюджетом и ищет запросы одной формы,
+повторенные N_PLUS_ONE_THRESHOLD и более раз, — типичный N+1.
+
+Режим задает QUERY_BUDGET:
+    off    — трекер выключен (по умолчанию в проде)
+    warn   — нарушения пишутся в лог db.budget (по умолчанию при app.debug)
+    strict — нарушение поднимает QueryBudgetError (по умолчанию при app.testing),
+             и тест через test_client падает
+"""
+
+import logging
+import os
+from collections import Counter
+from flask import current_app, g, has_request_context, request
+from db_metrics import normalize_sql, query_listeners
+
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", 10))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 3))
+TRANSACTION_STATEMENTS = ("COMMIT", "ROLLBACK")
+
+budget_log = logging.getLogger("db.budget")
+
+
+class QueryBudgetError(Exception):
+    pass
+
+
+def query_budget(limit):
+    # None — бюджета нет (например, массовый импорт)
+    def decorator(f):
+        f.query_budget = limit
+        return f
+
+    return decorator
+
+
+def budget_mode(app):
+    mode = os.getenv("QUERY_BUDGET")
+    if mode:
+        return mode
+    if app.testing:
+        return "strict"
+    if app.debug:
+        return "warn"
+    return "off"
+
+
+def _track_query(sql, params, seconds):
+    if not has_request_context():
+        return
+    statements = g.get("db_statements")
+    if statements is not None:
+        statements[normalize_sql(sql)] += 1
+
+
+def start_tracking():
+    if budget_mode(current_app) != "off":
+        g.db_statements = Counter()
+
+
+def request_report():
+    statements = g.get("db_statements")
+    if statements is None:
+        return None
+
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, "query_budget", QUERY_BUDGET_DEFAULT)
+    round_trips = sum(statements.values())
+    repeated = {
+        label: count
+        for label, count in statements.items()
+        if count >= N_PLUS_ONE_THRESHOLD and label not in TRANSACTION_STATEMENTS
+    }
+    return {
+        "endpoint": request.endpoint,
+        "round_trips": round_trips,
+        "statements": round_trips - sum(statements[s] for s in TRANSACTION_STATEMENTS),
+        "budget": budget,
+        "over_budget": budget is not None and round_trips > budget,
+        "repeated": repeated,
+    }
+
+
+def check_budget(response):
+    report = request_report()
+    if report is None or not (report["over_budget"] or report["repeated"]):
+        return response
+
+    problems = []
+    if report["over_budget"]:
+        problems.append(
+            f"{report['round_trips']} обращений к БД при бюджете {report['budget']}"
+        )
+    for label, count in report["repeated"].items():
+        problems.append(f"возможный N+1, {count} раз: {label}")
+    message = f"{request.method} {request.path} ({report['endpoint']}): " + "; ".join(problems)
+
+    if budget_mode(current_app) == "strict":
+        raise QueryBudgetError(message)
+    budget_log.warning(message)
+    return response
+
+
+def init_query_budget(app):
+    # Слушатель общий для всех приложений процесса (тесты создают свои)
+    if _track_query not in query_listeners:
+        query_listeners.append(_track_query)
+    app.before_request(start_tracking)
+    app.after_request(check_budget)
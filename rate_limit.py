@@ -0,0 +1,228 @@
+"""Ограничение частоты запросов (GCRA) с общим для воркеров состоянием.
+
+GCRA — вариант token bucket, которому на ключ нужно одно число: TAT,
+теоретическое время прихода следующего запроса. Запрос пропускается, если
+TAT отстает от текущего времени не больше чем на burst интервалов; иначе
+ответ 429 с Retry-After.
+
+Все лимиты политики (например, IP и пара email+IP для /login) проверяются и
+списываются вместе, одной транзакцией: если хоть один отказал, остальные
+не расходуются. Состояние хранится в SQLite-файле (RATE_LIMIT_SQLITE_PATH) —
+так его видят все воркеры gunicorn. Если задан RATE_LIMIT_REDIS_URL,
+используется Redis (Lua-скрипт, нужен пакет redis). При недоступном
+хранилище запросы пропускаются. RATE_LIMIT_ENABLED=0 выключает ограничения
+(тесты, нагрузочные прогоны).
+
+За прокси адрес клиента берется из RATE_LIMIT_IP_HEADER. X-Real-IP прокси
+перезаписывает целиком. В X-Forwarded-For каждый прокси дописывает адрес
+справа, а все, что левее, прислал сам клиент: клиентом считается
+RATE_LIMIT_TRUSTED_HOPS-й адрес справа (по числу своих прокси).
+"""
+
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from functools import wraps
+from flask import jsonify, request
+from tokens import decode_token
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "/tmp/blog-api-ratelimit.sqlite3")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+# За nginx адрес клиента приходит в заголовке (например, X-Real-IP)
+RATE_LIMIT_IP_HEADER = os.getenv("RATE_LIMIT_IP_HEADER")
+RATE_LIMIT_TRUSTED_HOPS = max(1, int(os.getenv("RATE_LIMIT_TRUSTED_HOPS", 1)))
+
+log = logging.getLogger(__name__)
+
+
+class Limit:
+    def __init__(self, key, rate, period, burst=1):
+        # rate запросов за period секунд, подряд можно burst без пауз
+        self.key = key
+        self.interval = period / rate
+        self.tolerance = self.interval * (burst - 1)
+
+
+# Ключ "user" без токена падает на IP, "email_ip" — адрес из тела /login вместе
+# с IP клиента: по одному email чужой адрес не может заблокировать вход владельцу,
+# перебор с одного адреса тормозит лимит "ip"
+POLICIES = {
+    "login": [Limit("ip", 20, 60, burst=10), Limit("email_ip", 5, 60, burst=5)],
+    "register": [Limit("ip", 10, 3600, burst=5)],
+    "upload": [Limit("user", 30, 60, burst=10)],
+    "comment": [Limit("user", 10, 60, burst=5), Limit("ip", 60, 60, burst=20)],
+}
+
+
+class SQLiteStore:
+    def __init__(self, path, cleanup_chance=0.001):
+        self.path = path
+        self.cleanup_chance = cleanup_chance
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Потеря последних записей при сбое ОС не страшна: лимиты просто обнулятся
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limit_tat (key TEXT PRIMARY KEY, tat REAL NOT NULL)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def hit(self, limits, now):
+        # limits — [(ключ, interval, tolerance)]. Возвращает, через сколько
+        # секунд повторить, или None; TAT сдвигается, только если прошли все
+        conn = self._connect()
+        keys = [key for key, _, _ in limits]
+        # IMMEDIATE: запись блокируется сразу, между чтением и записью никто не вклинится
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            stored = dict(
+                conn.execute(
+                    f"SELECT key, tat FROM rate_limit_tat WHERE key IN ({', '.join('?' * len(keys))})",
+                    keys,
+                )
+            )
+            retry_after = None
+            updates = []
+            for key, interval, tolerance in limits:
+                tat = max(stored.get(key, now), now)
+                if tat - now > tolerance:
+                    retry_after = max(retry_after or 0, tat - now - tolerance)
+                updates.append((key, tat + interval))
+            if retry_after is None:
+                conn.executemany(
+                    """INSERT INTO rate_limit_tat (key, tat) VALUES (?, ?)
+                       ON CONFLICT (key) DO UPDATE SET tat = excluded.tat""",
+                    updates,
+                )
+            # Ключи с TAT в прошлом ничем не отличаются от отсутствующих
+            if random.random() < self.cleanup_chance:
+                conn.execute("DELETE FROM rate_limit_tat WHERE tat < ?", (now,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+class RedisStore:
+    SCRIPT = """
+        local now = tonumber(ARGV[1])
+        local tats, wait = {}, nil
+        for i, key in ipairs(KEYS) do
+            local interval, tolerance = tonumber(ARGV[i * 2]), tonumber(ARGV[i * 2 + 1])
+            local tat = math.max(tonumber(redis.call('GET', key) or 0), now)
+            if tat - now > tolerance then
+                wait = math.max(wait or 0, tat - now - tolerance)
+            end
+            tats[i] = tat + interval
+        end
+        if wait then
+            return tostring(wait)
+        end
+        for i, key in ipairs(KEYS) do
+            redis.call('SET', key, tostring(tats[i]), 'PX', math.ceil((tats[i] - now) * 1000))
+        end
+        return false
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self._script = redis.Redis.from_url(url).register_script(self.SCRIPT)
+
+    def hit(self, limits, now):
+        args = [now]
+        for _, interval, tolerance in limits:
+            args += [interval, tolerance]
+        wait = self._script(keys=[f"rl:{key}" for key, _, _ in limits], args=args)
+        return None if wait is None else float(wait)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = RedisStore(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else SQLiteStore(RATE_LIMIT_SQLITE_PATH)
+        return _store
+
+
+def client_ip():
+    if RATE_LIMIT_IP_HEADER:
+        forwarded = request.headers.get(RATE_LIMIT_IP_HEADER)
+        if forwarded:
+            # Левые адреса мог подставить клиент, берем дописанный нашим прокси
+            addresses = [address.strip() for address in forwarded.split(",") if address.strip()]
+            if len(addresses) >= RATE_LIMIT_TRUSTED_HOPS:
+                return addresses[-RATE_LIMIT_TRUSTED_HOPS]
+    return request.remote_addr or "unknown"
+
+
+def limit_key(kind):
+    if kind == "user":
+        token = request.headers.get("Authorization")
+        if token and token.startswith("Bearer "):
+            try:
+                return f"user:{decode_token(token)['sub']}"
+            except Exception:
+                pass
+        return f"ip:{client_ip()}"
+    if kind == "email_ip":
+        data = request.get_json(silent=True)
+        email = data.get("email") if isinstance(data, dict) else None
+        return f"email:{str(email).strip().lower()}:ip:{client_ip()}" if email else None
+    return f"ip:{client_ip()}"
+
+
+def check(policy):
+    # Возвращает, через сколько секунд повторить, или None, если можно
+    limits = []
+    for limit in POLICIES[policy]:
+        key = limit_key(limit.key)
+        if key is None:
+            continue
+        # Вид лимита в ключе: "user" без токена падает на IP и не должен
+        # делить TAT с лимитом "ip" той же политики
+        limits.append((f"{policy}:{limit.key}:{key}", limit.interval, limit.tolerance))
+    if not limits:
+        return None
+    try:
+        return get_store().hit(limits, time.time())
+    except Exception:
+        log.exception("Rate limit store error")
+        return None
+
+
+def rate_limit(policy):
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if not RATE_LIMIT_ENABLED:
+                return f(*args, **kwargs)
+            retry_after = check(policy)
+            if retry_after is None:
+                return f(*args, **kwargs)
+            response = jsonify({"message": "Слишком много запросов, попробуйте позже"})
+            response.status_code = 429
+            response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+            if request.content_length:
+                # Тело (например, 5 МБ загрузки) не дочитываем
+                response.headers["Connection"] = "close"
+            return response
+
+        return decorated
+
+    return decorator
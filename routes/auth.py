@@ -1,9 +1,42 @@
 from flask import request, jsonify
 from routes.customvalidator import is_valid_data
-import bcrypt
 import jwt
+import logging
 import time
+import pymysql
 from config import SECRET_KEY, get_db_connection
+from cache_store import profile_cache, read_through
+from tokens import decode_token
+from hashing import HashingBusyError, check_password, hash_password, needs_rehash
+
+# ER_DUP_ENTRY
+DUPLICATE_ENTRY = 1062
+
+log = logging.getLogger(__name__)
+
+FULL_INFO_SQL = """
+        SELECT id, nickname, email, bio, banner_url, status, DATE_FORMAT(created_at, '%%d.%%m.%%Y') as created_at, is_active 
+        FROM users 
+        WHERE id = %s
+    """
+
+SHORT_INFO_SQL = """
+        SELECT id, nickname, bio, banner_url, status, DATE_FORMAT(created_at, '%%d.%%m.%%Y') as created_at, is_active 
+        FROM users 
+        WHERE id = %s
+    """
+
+
+def get_profile(user_id, is_owner=False):
+    def load_user():
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(FULL_INFO_SQL if is_owner else SHORT_INFO_SQL, (user_id,))
+                return cursor.fetchone()
+
+    # Владелец и гости кэшируются раздельно: email есть только в записи владельца
+    view = "owner" if is_owner else "public"
+    return read_through(profile_cache, f"{user_id}:{view}", [f"user:{user_id}"], load_user)
 
 
 def userData(target_user_id):
@@ -12,11 +45,7 @@ def userData(target_user_id):
 
     if token and token.startswith("Bearer "):
         try:
-            token = token[7:]
-
-            data = jwt.decode(
-                token, SECRET_KEY, algorithms=["HS256"], options={"require_exp": True}
-            )
+            data = decode_token(token)
             current_user = data.get("sub", 0)
         except Exception:
             pass
@@ -25,24 +54,7 @@ def userData(target_user_id):
     isOwner = self_user_id == target_user_id
 
     try:
-        full_info_sql = """
-                SELECT id, nickname, email, bio, banner_url, status, DATE_FORMAT(created_at, '%%d.%%m.%%Y') as created_at, is_active 
-                FROM users 
-                WHERE id = %s
-            """
-
-        short_info_sql = """
-                SELECT id, nickname, bio, banner_url, status, DATE_FORMAT(created_at, '%%d.%%m.%%Y') as created_at, is_active 
-                FROM users 
-                WHERE id = %s
-            """
-
-        sql = full_info_sql if isOwner else short_info_sql
-
-        with get_db_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(sql, (target_user_id,))
-                user = cursor.fetchone()
+        user = get_profile(target_user_id, isOwner)
 
         if not user:
             return jsonify({"isError": True, "message": "Неверные данные"}), 401
@@ -67,6 +79,27 @@ def userData(target_user_id):
         return jsonify({"isError": True, "message": str(e)}), 500
 
 
+def busy_response(error):
+    response = jsonify({"isError": True, "message": str(error)})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+def upgrade_password_hash(user_id, password):
+    # Стоимость bcrypt подняли: перехешируем при успешном входе, ошибки не критичны
+    try:
+        new_hash = hash_password(password)
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "UPDATE users SET password_hash = %s WHERE id = %s",
+                    (new_hash, user_id),
+                )
+                conn.commit()
+    except Exception:
+        log.exception("Password rehash error")
+
+
 def login():
     auth_data = request.get_json()
 
@@ -88,12 +121,12 @@ def login():
         if not user:
             return jsonify({"isError": True, "message": "Неверные данные"}), 401
 
-        if not bcrypt.checkpw(
-            password.encode("utf-8"),
-            user["password_hash"].encode("utf-8"),
-        ):
+        if not check_password(password, user["password_hash"]):
             return jsonify({"isError": True, "message": "Неверные данные"}), 401
 
+        if needs_rehash(user["password_hash"]):
+            upgrade_password_hash(user["id"], password)
+
         current_time = int(time.time())
         token = jwt.encode(
             {
@@ -119,6 +152,9 @@ def login():
     except jwt.PyJWKError:
         return jsonify({"isError": True, "message": "Ошибка при генерации токена"}), 500
 
+    except HashingBusyError as e:
+        return busy_response(e)
+
     except Exception as e:
         print(f"Login error: {str(e)}")
         return jsonify({"isError": True, "message": "Внутренняя ошибка сервера"}), 500
@@ -140,23 +176,25 @@ def register():
     password = reg_data["password"]
 
     try:
+        # Хешируем до того, как взять соединение из пула: bcrypt долгий
+        password_hash = hash_password(password)
+
+        # Занятость email проверяет уникальный индекс idx_users_email
+        # (migrations/007), отдельный SELECT не нужен и не спасает от гонки
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute("SELECT id FROM users WHERE email = %s", (email,))
-                if cursor.fetchone():
+                sql = "INSERT INTO users (email, password_hash, nickname) VALUES (%s, %s, %s)"
+                try:
+                    cursor.execute(sql, (email, password_hash, nickname))
+                except pymysql.err.IntegrityError as e:
+                    if e.args[0] != DUPLICATE_ENTRY:
+                        raise
                     return jsonify(
                         {
                             "isError": True,
                             "message": "Пользователь с таким email уже существует",
                         }
                     ), 409
-
-                password_hash = bcrypt.hashpw(
-                    password.encode("utf-8"), bcrypt.gensalt()
-                )
-
-                sql = "INSERT INTO users (email, password_hash, nickname) VALUES (%s, %s, %s)"
-                cursor.execute(sql, (email, password_hash.decode("utf-8"), nickname))
                 new_user_id = cursor.lastrowid
                 conn.commit()
 
@@ -180,6 +218,8 @@ def register():
                 "token": token,
             }
         ), 201
+    except HashingBusyError as e:
+        return busy_response(e)
     except Exception as e:
         return jsonify(
             {"isError": True, "message": "Ошибка при регистрации", "detail": str(e)}
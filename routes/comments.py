@@ -1,5 +1,11 @@
 from flask import jsonify, request
+from datetime import datetime
 from config import get_db_connection
+from cache_store import invalidate
+from routes.posts import encode_cursor, decode_cursor
+from routes.auth import get_profile
+from search_index import stem_text
+from counters import comment_counts
 
 
 def getComments(post_id):
@@ -11,13 +17,11 @@ def getComments(post_id):
                     c.id, 
                     c.post_id, 
                     c.user_id, 
-                    u.nickname, 
+                    c.author_nickname AS nickname, 
                     c.content,
                     c.parent_id,
                     DATE_FORMAT(c.created_at, '%%d.%%m.%%Y в %%H:%%i') AS created_at 
                     FROM comments c 
-                    JOIN users u 
-                    ON c.user_id = u.id 
                     WHERE c.post_id = %s;""",
                     (post_id),
                 )
@@ -41,6 +45,145 @@ def getComments(post_id):
         )
 
 
+def int_arg(name, default, maximum):
+    value = request.args.get(name, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return max(1, min(value, maximum))
+
+
+def getCommentTree(post_id):
+    limit = int_arg("limit", 20, 100)
+    depth = int_arg("depth", 3, 10)
+    preview = int_arg("replies", 3, 50)
+    if limit is None or depth is None or preview is None:
+        return jsonify({"message": "Некорректный запрос"}), 400
+
+    where = ""
+    params = [post_id]
+    cursor_arg = request.args.get("cursor")
+    if cursor_arg:
+        position = decode_cursor(cursor_arg)
+        if position is None:
+            return jsonify({"message": "Некорректный курсор"}), 400
+        created_at, last_id = position
+        where = "AND (created_at > %s OR (created_at = %s AND id > %s))"
+        params += [created_at, created_at, last_id]
+
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                # Страница веток: только комментарии верхнего уровня
+                cursor.execute(
+                    f"""SELECT id, created_at FROM comments
+                    WHERE post_id = %s AND parent_id IS NULL {where}
+                    ORDER BY created_at, id
+                    LIMIT %s;""",
+                    (*params, limit + 1),
+                )
+                roots = cursor.fetchall()
+
+                next_cursor = None
+                if len(roots) > limit:
+                    roots = roots[:limit]
+                    next_cursor = encode_cursor(roots[-1]["created_at"], roots[-1]["id"])
+
+                if not roots:
+                    return jsonify(
+                        {
+                            "message": "Комментарии не найдены",
+                            "comments": [],
+                            "next_cursor": None,
+                        }
+                    )
+
+                # Ответы ранжируются внутри родителя, и обход спускается только
+                # к первым preview из них: популярная ветка с тысячами ответов не
+                # читается целиком. Оконные функции в рекурсивной части MySQL
+                # запрещены, поэтому ранжирование — отдельным CTE по покрывающему
+                # индексу (post_id, parent_id, created_at); content читается только
+                # для отдаваемых строк. Уровнем глубже, чем отдаем, берем по одному
+                # ответу — ради siblings, числа ответов у самых глубоких узлов
+                root_ids = [root["id"] for root in roots]
+                placeholders = ", ".join(["%s"] * len(root_ids))
+                cursor.execute(
+                    f"""WITH RECURSIVE replies (id, parent_id, position, siblings) AS (
+                        SELECT id, parent_id,
+                        ROW_NUMBER() OVER (PARTITION BY parent_id ORDER BY created_at, id),
+                        COUNT(*) OVER (PARTITION BY parent_id)
+                        FROM comments
+                        WHERE post_id = %s AND parent_id IS NOT NULL
+                    ),
+                    thread (id, level, siblings) AS (
+                        SELECT id, 1, 0 FROM comments
+                        WHERE post_id = %s AND id IN ({placeholders})
+                        UNION ALL
+                        SELECT r.id, t.level + 1, r.siblings FROM replies r
+                        JOIN thread t ON r.parent_id = t.id
+                        WHERE t.level <= %s AND r.position <= IF(t.level = %s, 1, %s)
+                    )
+                    SELECT 
+                    c.id, 
+                    c.post_id, 
+                    c.user_id, 
+                    c.author_nickname AS nickname, 
+                    c.content,
+                    c.parent_id,
+                    t.level,
+                    t.siblings AS sibling_count,
+                    DATE_FORMAT(c.created_at, '%%d.%%m.%%Y в %%H:%%i') AS created_at 
+                    FROM thread t
+                    JOIN comments c ON c.id = t.id
+                    ORDER BY c.created_at, c.id;""",
+                    (post_id, post_id, *root_ids, depth, depth, preview),
+                )
+                rows = cursor.fetchall()
+
+        return jsonify(
+            {
+                "message": "Комментарии успешно получены",
+                "comments": build_comment_tree(rows, root_ids, depth),
+                "next_cursor": next_cursor,
+            }
+        )
+
+    except Exception as e:
+        return jsonify(
+            {
+                "message": "Ошибка при получении комментариев, подробности в консоли",
+                "detail": str(e),
+            }
+        ), 500
+
+
+def build_comment_tree(rows, root_ids, depth):
+    # Один проход: строки отсортированы по времени, значит родитель всегда
+    # встречается раньше своих ответов. Лишние ответы отрезал SQL, а у каждого
+    # ответа есть sibling_count — сколько всего ответов у его родителя
+    nodes = {}
+    for row in rows:
+        level = row.pop("level")
+        sibling_count = row.pop("sibling_count")
+        parent = nodes.get(row["parent_id"])
+        if parent is not None:
+            parent["reply_count"] = sibling_count
+        if level > depth:
+            continue
+
+        row["replies"] = []
+        row["reply_count"] = 0
+        nodes[row["id"]] = row
+        if parent is not None:
+            parent["replies"].append(row)
+
+    for node in nodes.values():
+        node["has_more_replies"] = node["reply_count"] > len(node["replies"])
+
+    return [nodes[root_id] for root_id in root_ids if root_id in nodes]
+
+
 def addComment(current_user, post_id):
     data = request.get_data()
 
@@ -56,56 +199,53 @@ def addComment(current_user, post_id):
         return jsonify({"message": "Комментарий должен быть больше 5 символов"}), 400
 
     user_id = current_user
-    post_id = data["post_id"]
+    try:
+        post_id = int(data["post_id"])
+    except (TypeError, ValueError):
+        return jsonify({"message": "Некорректный id поста"}), 400
     content = data["content"]
     parent_id = data.get("parent_id")
 
-    sql = "INSERT INTO comments (post_id, user_id, content) VALUES (%s, %s, %s)"
-    values = [post_id, user_id, content]
-
-    if parent_id is not None:
-        sql = "INSERT INTO comments (post_id, user_id, content, parent_id) VALUES (%s, %s, %s, %s)"
-        values.append(parent_id)
+    # Ник автора копируется в комментарий тем же запросом
+    sql = """INSERT INTO comments (post_id, user_id, content, search_text, parent_id, author_nickname)
+             SELECT %s, %s, %s, %s, %s, nickname FROM users WHERE id = %s"""
+    values = [post_id, user_id, content, stem_text(content), parent_id, user_id]
 
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cursor:
                 cursor.execute(sql, values)
+                if cursor.rowcount == 0:
+                    return jsonify({"message": "Пользователь не найден"}), 404
                 comment_id = cursor.lastrowid
-                cursor.execute(
-                    "UPDATE posts SET comment_count = comment_count + 1 WHERE id = %s",
-                    (post_id,),
-                )
                 cursor.connection.commit()
+                now = datetime.now()
+        # comment_count и кэш ленты обновит отложенный сброс счетчиков
+        comment_counts.touch(post_id)
+        invalidate(f"comments:{post_id}")
 
-                cursor.execute(
-                    """SELECT 
-                    c.id,
-                    c.post_id,
-                    c.parent_id,
-                    c.user_id,
-                    u.nickname,
-                    c.content, 
-                    DATE_FORMAT(c.created_at, '%%d.%%m.%%Y в %%H:%%i') AS created_at 
-                    FROM comments c 
-                    JOIN users u 
-                    ON c.user_id = u.id 
-                    WHERE c.id = %s;""",
-                    (comment_id,),
-                )
-                comment = cursor.fetchone()
+        # Ответ собирается из того, что уже есть, без повторного SELECT;
+        # ник — из кэша профилей (тот же, что INSERT скопировал из users)
+        author = get_profile(int(user_id))
+        comment = {
+            "id": comment_id,
+            "post_id": post_id,
+            "parent_id": parent_id,
+            "user_id": int(user_id),
+            "nickname": author["nickname"] if author else "",
+            "content": content,
+            "created_at": now.strftime("%d.%m.%Y в %H:%M"),
+        }
 
-                if comment["parent_id"] is not None:
-                    return jsonify(
-                        {
-                            "message": "Комментарий успешно добавлен",
-                            "commentsReplies": comment,
-                        }
-                    )
+        if comment["parent_id"] is not None:
+            return jsonify(
+                {
+                    "message": "Комментарий успешно добавлен",
+                    "commentsReplies": comment,
+                }
+            )
 
-                return jsonify(
-                    {"message": "Комментарий успешно добавлен", "comment": comment}
-                )
+        return jsonify({"message": "Комментарий успешно добавлен", "comment": comment})
 
     except Exception as e:
         print({"Ошибка": str(e)})
@@ -141,12 +281,9 @@ def delComment(current_user, comment_id):
                         {"message": "У вас нет прав на удаление этого комментария"}
                     ), 403
 
-                cursor.execute(
-                    "UPDATE posts SET comment_count = GREATEST(0, comment_count - 1) WHERE id = %s",
-                    (post_id,),
-                )
-
                 cursor.connection.commit()
+                comment_counts.touch(post_id)
+                invalidate(f"comments:{post_id}")
                 return jsonify({"message": "Комментарий успешно удален"}), 200
 
     except Exception as e:
@@ -1,6 +1,15 @@
 from flask import jsonify, request
+import base64
+import json
+import math
+import os
+import re
 from datetime import datetime
 from config import get_db_connection
+from cache_store import invalidate, post_cache, read_through
+from search_index import post_search_text
+from storage import update_refs
+from routes.auth import get_profile
 
 
 class DBConnection:
@@ -45,37 +54,110 @@ def post_validation(data):
         ), 400
 
 
+POSTS_PAGE_SIZE = int(os.getenv("POSTS_PAGE_SIZE", 20))
+POSTS_MAX_PAGE_SIZE = 100
+
+
+# Колонка excerpt — VARCHAR(400), с учетом многоточия
+EXCERPT_LENGTH = min(int(os.getenv("POST_EXCERPT_LENGTH", 300)), 399)
+WORDS_PER_MINUTE = 200
+
+TAG_RE = re.compile(r"<[^>]+>")
+SPACE_RE = re.compile(r"\s+")
+
+
+def build_summary(content):
+    # Считается один раз при записи поста, лента читает готовые значения
+    text = SPACE_RE.sub(" ", TAG_RE.sub(" ", content)).strip()
+    word_count = len(text.split())
+
+    excerpt = text
+    if len(text) > EXCERPT_LENGTH:
+        excerpt = text[:EXCERPT_LENGTH].rsplit(" ", 1)[0].rstrip(".,;:!?- ") + "…"
+
+    return {
+        "excerpt": excerpt,
+        "word_count": word_count,
+        "reading_time": max(1, math.ceil(word_count / WORDS_PER_MINUTE)),
+    }
+
+
+def encode_cursor(sort_at, post_id):
+    raw = json.dumps([sort_at.isoformat(), post_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_at, post_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(sort_at), int(post_id)
+    except (ValueError, TypeError):
+        return None
+
+
 def get_posts():
+    try:
+        limit = int(request.args.get("limit", POSTS_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"message": "Некорректный limit"}), 400
+    limit = max(1, min(limit, POSTS_MAX_PAGE_SIZE))
+
+    if request.args.get("fields", "full") == "summary":
+        body_columns = "p.excerpt, p.word_count, p.reading_time,"
+    else:
+        body_columns = "p.content,"
+
+    cursor_arg = request.args.get("cursor")
+    where = ""
+    params = []
+    if cursor_arg:
+        position = decode_cursor(cursor_arg)
+        if position is None:
+            return jsonify({"message": "Некорректный курсор"}), 400
+        sort_at, last_id = position
+        # Keyset-пагинация по индексу (sort_at, id)
+        where = "WHERE p.sort_at < %s OR (p.sort_at = %s AND p.id < %s)"
+        params = [sort_at, sort_at, last_id]
+
     with DBConnection() as cursor:
         cursor.execute(
-            """SELECT 
+            f"""SELECT 
                     p.id, 
-                    DATE_FORMAT(p.created_at, '%d.%m.%Y, %H:%i') AS created_at, 
-                    DATE_FORMAT(p.updated_at, '%d.%m.%Y, %H:%i') AS updated_at, 
+                    DATE_FORMAT(p.created_at, '%%d.%%m.%%Y, %%H:%%i') AS created_at, 
+                    DATE_FORMAT(p.updated_at, '%%d.%%m.%%Y, %%H:%%i') AS updated_at, 
                     p.title, 
-                    p.content, 
+                    {body_columns}
                     p.author_id,
                     p.is_pinned,
                     p.is_ad,
                     p.comment_count,
-                    u.nickname AS author_nickname
+                    p.sort_at,
+                    p.author_nickname
                     FROM posts p 
-                    JOIN users u 
-                    ON p.author_id = u.id 
+                    {where}
                     ORDER BY
-                        COALESCE(p.updated_at, p.created_at) DESC;
-                    """
+                        p.sort_at DESC, p.id DESC
+                    LIMIT %s;
+                    """,
+            (*params, limit + 1),
         )
+        posts = cursor.fetchall()
 
-        return jsonify({"posts": cursor.fetchall()})
+        next_cursor = None
+        if len(posts) > limit:
+            posts = posts[:limit]
+            next_cursor = encode_cursor(posts[-1]["sort_at"], posts[-1]["id"])
 
+        for post in posts:
+            del post["sort_at"]
 
-def get_post(post_id):
-    if not post_id:
-        return jsonify({"message": "Некорректный запрос"}), 400
+        return jsonify({"posts": posts, "next_cursor": next_cursor})
 
-    try:
-        with DBConnection() as cursor:
+
+def fetch_post(post_id):
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
             cursor.execute(
                 """SELECT 
                         p.id, 
@@ -85,17 +167,29 @@ def get_post(post_id):
                         DATE_FORMAT(p.updated_at, '%%d.%%m.%%Y, %%H:%%i') AS updated_at, 
                         p.author_id, 
                         p.comment_count,
-                        u.nickname AS author_nickname 
+                        p.author_nickname 
                         FROM posts p 
-                        JOIN users u 
-                        ON p.author_id = u.id 
                         WHERE p.id = %s
                     """,
                 (post_id,),
             )
-            post = cursor.fetchone()
-            if post is None:
-                return jsonify({"isError": True, "message": "Пост не найден"}), 404
+            return cursor.fetchone()
+
+
+def get_post(post_id):
+    if not post_id:
+        return jsonify({"message": "Некорректный запрос"}), 400
+
+    try:
+        # nicknames — ник автора живет в users и меняется через updateUser
+        post = read_through(
+            post_cache,
+            post_id,
+            [f"post:{post_id}", "nicknames"],
+            lambda: fetch_post(post_id),
+        )
+        if post is None:
+            return jsonify({"isError": True, "message": "Пост не найден"}), 404
 
         return jsonify({"isError": False, "post": post})
     except Exception as e:
@@ -156,21 +250,45 @@ def new_post(current_user):
             }
         ), 400
 
-    with DBConnection() as cursor:
-        cursor.execute("SELECT nickname FROM users WHERE id = %s", (current_user,))
-        user = cursor.fetchone()
+    summary = build_summary(data["content"])
+    post_id = None
 
-        if not user:
+    with DBConnection() as cursor:
+        # Ник автора копируется в пост тем же запросом: нет окна, в котором
+        # его успеют поменять между чтением и вставкой
+        sql = """INSERT INTO posts
+                 (title, content, author_id, author_nickname, excerpt, word_count, reading_time,
+                  search_text)
+                 SELECT %s, %s, %s, nickname, %s, %s, %s, %s FROM users WHERE id = %s"""
+        cursor.execute(
+            sql,
+            (
+                data["title"],
+                data["content"],
+                current_user,
+                summary["excerpt"],
+                summary["word_count"],
+                summary["reading_time"],
+                post_search_text(data["title"], data["content"]),
+                current_user,
+            ),
+        )
+        if cursor.rowcount == 0:
             return jsonify({"message": "Пользователь не найден"}), 404
-
-        author_nickname = user["nickname"]
-
-        sql = "INSERT INTO posts (title, content, author_id) VALUES (%s, %s, %s)"
-        cursor.execute(sql, (data["title"], data["content"], current_user))
         post_id = cursor.lastrowid
+        # Картинки в тексте — ссылки на загруженные объекты, берем их
+        update_refs(cursor, None, data["content"])
         cursor.connection.commit()
+        invalidate("posts")
         now = datetime.now()
 
+    if post_id is None:
+        return jsonify({"message": "Ошибка при добавлении поста"}), 500
+
+    # Ник для ответа — из кэша профилей, в базу идем только при промахе
+    author = get_profile(int(current_user))
+    author_nickname = author["nickname"] if author else ""
+
     return jsonify(
         {
             "message": "Пост успешно добавлен",
@@ -178,6 +296,7 @@ def new_post(current_user):
                 "id": post_id,
                 "title": data["title"],
                 "content": data["content"],
+                **summary,
                 "author_id": current_user,
                 "author_nickname": author_nickname,
                 "created_at": now.strftime("%d.%m.%Y, %H:%M"),
@@ -198,23 +317,46 @@ def upd_post(current_user, post_id):
 
     title = data.get("title")
     content = data.get("content")
+    summary = build_summary(content)
 
     with DBConnection() as cursor:
+        # Старый текст нужен, чтобы пересчитать ссылки на картинки.
+        # FOR UPDATE: параллельная правка не посчитает ту же разницу второй раз
         cursor.execute(
-            "UPDATE posts SET title = %s, content = %s, updated_at = NOW() WHERE id = %s AND author_id = %s;",
-            (title, content, post_id, current_user),
+            "SELECT content FROM posts WHERE id = %s AND author_id = %s FOR UPDATE",
+            (post_id, current_user),
         )
-        if cursor.rowcount == 0:
+        previous = cursor.fetchone()
+        if previous is None:
             return jsonify(
                 {"message": "Пост не найден или у вас нет прав на его удаление"}
             ), 404
+        cursor.execute(
+            """UPDATE posts
+               SET title = %s, content = %s, excerpt = %s, word_count = %s, reading_time = %s,
+                   search_text = %s, updated_at = NOW()
+               WHERE id = %s;""",
+            (
+                title,
+                content,
+                summary["excerpt"],
+                summary["word_count"],
+                summary["reading_time"],
+                post_search_text(title, content),
+                post_id,
+            ),
+        )
+        # Счетчики ссылок на картинки: убранные отпускаем, добавленные берем
+        update_refs(cursor, previous["content"], content)
         cursor.connection.commit()
+        invalidate("posts", f"post:{post_id}")
         now = datetime.now()
 
     return jsonify(
         {
             "message": "Пост успешно изменен",
             "updated_at": now.strftime("%d.%m.%Y, %H:%M"),
+            **summary,
         }
     )
 
@@ -222,14 +364,19 @@ def upd_post(current_user, post_id):
 def del_post(current_user, post_id):
     with DBConnection() as cursor:
         cursor.execute(
-            "DELETE FROM posts WHERE id = %s AND author_id = %s;",
+            "SELECT content FROM posts WHERE id = %s AND author_id = %s FOR UPDATE",
             (post_id, current_user),
         )
-        if cursor.rowcount == 0:
+        post = cursor.fetchone()
+        if post is None:
             return jsonify(
                 {"message": "Пост не найден или у вас нет прав на его удаление"}
             ), 404
+        cursor.execute("DELETE FROM posts WHERE id = %s;", (post_id,))
+        # Снимаем ссылки поста на картинки; объекты без ссылок удалит python storage.py gc
+        update_refs(cursor, post["content"], None)
         cursor.connection.commit()
+        invalidate("posts", f"post:{post_id}")
 
         return jsonify({"message": "Пост был удален :("})
 
@@ -249,15 +396,16 @@ def toggle_option(current_user, post_id):
         return jsonify({"message": "Недопустимая опция"}), 400
 
     with DBConnection() as cursor:
-        query = f"SELECT {option} FROM `posts` WHERE id = %s"
+        # Переключение одним UPDATE, без гонки чтение-запись. Новое значение
+        # возвращается через LAST_INSERT_ID(expr) в cursor.lastrowid —
+        # в MySQL это замена RETURNING
+        query = f"UPDATE posts SET {option} = LAST_INSERT_ID(NOT {option}) WHERE id = %s"
         cursor.execute(query, (post_id,))
-        current_value = cursor.fetchone()
-
-        new_value = 0 if current_value[option] else 1
-
-        query = f"UPDATE posts SET {option} = %s WHERE id = %s"
-        cursor.execute(query, (new_value, post_id))
+        if cursor.rowcount == 0:
+            return jsonify({"message": "Пост не найден"}), 404
+        new_value = cursor.lastrowid
         cursor.connection.commit()
+        invalidate("posts", f"post:{post_id}")
 
         return jsonify(
             {
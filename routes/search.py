@@ -0,0 +1,106 @@
+from flask import jsonify, request
+import logging
+import os
+from config import get_db_connection
+from search_index import boolean_query, make_snippet, query_terms
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+# Строки постов и комментариев читаются только для SEARCH_MAX_CANDIDATES
+# лучших по релевантности совпадений: ORDER BY MATCH ... DESC LIMIT InnoDB
+# берет из полнотекстового индекса без сортировки всей выборки. OFFSET пролистывает
+# результаты, поэтому глубже SEARCH_MAX_RESULTS страницы не листаются
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", 1000))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", 200))
+
+log = logging.getLogger(__name__)
+
+
+def search():
+    terms = query_terms(request.args.get("q", ""))
+    if not terms:
+        return jsonify({"message": "Слишком короткий запрос"}), 400
+
+    search_type = request.args.get("type", "posts")
+    if search_type not in ("posts", "comments"):
+        return jsonify({"message": "Некорректный тип поиска"}), 400
+
+    try:
+        page = max(1, int(request.args.get("page", 1)))
+        limit = int(request.args.get("limit", SEARCH_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"message": "Некорректный запрос"}), 400
+    limit = max(1, min(limit, SEARCH_MAX_PAGE_SIZE))
+
+    match = boolean_query(terms)
+
+    offset = (page - 1) * limit
+    if offset >= SEARCH_MAX_RESULTS:
+        return jsonify({"message": f"Доступны только первые {SEARCH_MAX_RESULTS} результатов"}), 400
+
+    # Кандидаты отбираются по FULLTEXT-индексу без сортировки и без чтения
+    # строк; колонки (content) читаются только для отдаваемой страницы
+    if search_type == "posts":
+        sql = """SELECT
+                p.id,
+                p.title,
+                p.content,
+                p.author_id,
+                p.comment_count,
+                DATE_FORMAT(p.created_at, '%%d.%%m.%%Y, %%H:%%i') AS created_at,
+                m.score
+                FROM (
+                    SELECT id, MATCH(search_text) AGAINST (%s IN BOOLEAN MODE) AS score
+                    FROM posts
+                    WHERE MATCH(search_text) AGAINST (%s IN BOOLEAN MODE)
+                    ORDER BY MATCH(search_text) AGAINST (%s IN BOOLEAN MODE) DESC
+                    LIMIT %s
+                ) m
+                JOIN posts p ON p.id = m.id
+                ORDER BY m.score DESC, p.id DESC
+                LIMIT %s OFFSET %s;"""
+    else:
+        sql = """SELECT
+                c.id,
+                c.post_id,
+                c.user_id,
+                c.content,
+                DATE_FORMAT(c.created_at, '%%d.%%m.%%Y в %%H:%%i') AS created_at,
+                m.score
+                FROM (
+                    SELECT id, MATCH(search_text) AGAINST (%s IN BOOLEAN MODE) AS score
+                    FROM comments
+                    WHERE MATCH(search_text) AGAINST (%s IN BOOLEAN MODE)
+                    ORDER BY MATCH(search_text) AGAINST (%s IN BOOLEAN MODE) DESC
+                    LIMIT %s
+                ) m
+                JOIN comments c ON c.id = m.id
+                ORDER BY m.score DESC, c.id DESC
+                LIMIT %s OFFSET %s;"""
+
+    # Последняя страница обрезается по SEARCH_MAX_RESULTS
+    page_size = min(limit, SEARCH_MAX_RESULTS - offset)
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, (match, match, match, SEARCH_MAX_CANDIDATES, page_size + 1, offset))
+                results = cursor.fetchall()
+    except Exception as e:
+        log.exception("Search error")
+        return jsonify({"message": "Ошибка поиска", "detail": str(e)}), 500
+
+    has_more = len(results) > page_size and offset + page_size < SEARCH_MAX_RESULTS
+    results = results[:page_size]
+    for result in results:
+        # Полный текст не отдаем, только фрагмент вокруг совпадения
+        result["snippet"] = make_snippet(result.pop("content"), terms)
+        result["score"] = round(float(result["score"]), 4)
+
+    return jsonify(
+        {
+            "type": search_type,
+            "results": results,
+            "page": page,
+            "next_page": page + 1 if has_more else None,
+        }
+    )
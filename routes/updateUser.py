@@ -1,5 +1,6 @@
 from flask import request, jsonify
 from config import get_db_connection
+from cache_store import invalidate
 
 
 def build_update_query(userData, user_id):
@@ -65,7 +66,21 @@ def updateUser(current_user, user_id):
             connection = get_db_connection()
             with connection.cursor() as cursor:
                 cursor.execute(sql, values)
+                if "nickname" in userData:
+                    # Ник продублирован в постах и комментариях, чтобы лента
+                    # и комментарии читались без JOIN с users
+                    cursor.execute(
+                        "UPDATE posts SET author_nickname = %s WHERE author_id = %s",
+                        (userData["nickname"], int(current_user)),
+                    )
+                    cursor.execute(
+                        "UPDATE comments SET author_nickname = %s WHERE user_id = %s",
+                        (userData["nickname"], int(current_user)),
+                    )
                 connection.commit()
+                invalidate(f"user:{int(current_user)}")
+                if "nickname" in userData:
+                    invalidate("nicknames", "posts")
                 return jsonify({"message": "Данные успешно сохранены"}), 201
         else:
             return jsonify({"message": "Нет данных для обновления"}), 400
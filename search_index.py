@@ -0,0 +1,125 @@
+"""Полнотекстовый поиск: стемминг и поддержка индекса.
+
+MySQL FULLTEXT не умеет в русскую морфологию, поэтому в колонке search_text
+хранится текст, уже приведенный к основам слов (Snowball), и по ней строится
+FULLTEXT-индекс. Заполнить колонку для существующих записей:
+
+    python search_index.py reindex
+"""
+
+import re
+import sys
+import snowballstemmer
+from config import get_db_connection
+
+WORD_RE = re.compile(r"[0-9a-zа-яё]+", re.IGNORECASE)
+TAG_RE = re.compile(r"<[^>]+>")
+# Короче этого MySQL слова не индексирует (innodb_ft_min_token_size)
+MIN_TOKEN_SIZE = 3
+MAX_QUERY_TERMS = 8
+SNIPPET_RADIUS = 80
+
+_stemmers = {
+    "russian": snowballstemmer.stemmer("russian"),
+    "english": snowballstemmer.stemmer("english"),
+}
+
+
+def stem_word(word):
+    word = word.lower().replace("ё", "е")
+    language = "russian" if re.search("[а-я]", word) else "english"
+    return _stemmers[language].stemWord(word)
+
+
+def stem_text(text):
+    words = WORD_RE.findall(TAG_RE.sub(" ", text or ""))
+    return " ".join(stem_word(word) for word in words)
+
+
+def post_search_text(title, content):
+    # Заголовок дважды — простой способ поднять его вес в MATCH
+    return stem_text(f"{title} {title} {content}")
+
+
+def query_terms(query):
+    terms = []
+    for word in WORD_RE.findall(query or ""):
+        stem = stem_word(word)
+        if len(stem) >= MIN_TOKEN_SIZE and stem not in terms:
+            terms.append(stem)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def boolean_query(terms):
+    # +основа* — слово обязательно, любые окончания (префиксный поиск)
+    return " ".join(f"+{term}*" for term in terms)
+
+
+def make_snippet(text, terms):
+    text = re.sub(r"\s+", " ", TAG_RE.sub(" ", text or "")).strip()
+    lowered = text.lower().replace("ё", "е")
+
+    positions = [
+        match.start()
+        for term in terms
+        for match in [re.search(rf"\b{re.escape(term)}", lowered)]
+        if match
+    ]
+    if not positions:
+        return text[: SNIPPET_RADIUS * 2]
+
+    start = max(0, min(positions) - SNIPPET_RADIUS)
+    end = min(len(text), start + SNIPPET_RADIUS * 2)
+    snippet = text[start:end]
+    if start > 0:
+        snippet = "…" + snippet
+    if end < len(text):
+        snippet += "…"
+    return snippet
+
+
+def reindex(batch_size=500):
+    updated = 0
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            last_id = 0
+            while True:
+                cursor.execute(
+                    "SELECT id, title, content FROM posts WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, batch_size),
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                cursor.executemany(
+                    "UPDATE posts SET search_text = %s WHERE id = %s",
+                    [(post_search_text(r["title"], r["content"]), r["id"]) for r in rows],
+                )
+                conn.commit()
+                last_id = rows[-1]["id"]
+                updated += len(rows)
+
+            last_id = 0
+            while True:
+                cursor.execute(
+                    "SELECT id, content FROM comments WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, batch_size),
+                )
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                cursor.executemany(
+                    "UPDATE comments SET search_text = %s WHERE id = %s",
+                    [(stem_text(r["content"]), r["id"]) for r in rows],
+                )
+                conn.commit()
+                last_id = rows[-1]["id"]
+                updated += len(rows)
+    return updated
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["reindex"]:
+        print(f"Переиндексировано записей: {reindex()}")
+    else:
+        print(__doc__)
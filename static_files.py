@@ -0,0 +1,53 @@
+"""Отдача файлов из uploads/.
+
+STATIC_SENDFILE_MODE:
+    ""           — отдает сам Flask (Range, If-None-Match, If-Modified-Since
+                   поддерживаются werkzeug)
+    "x-sendfile" — заголовок X-Sendfile с абсолютным путем (Apache, lighttpd)
+    "x-accel"    — заголовок X-Accel-Redirect для nginx, нужен internal-location:
+
+        location /_uploads/ {
+            internal;
+            alias /app/uploads/;
+            etag on;
+        }
+"""
+
+import mimetypes
+import os
+from flask import current_app, send_from_directory, abort, make_response
+from werkzeug.security import safe_join
+
+STATIC_SENDFILE_MODE = os.getenv("STATIC_SENDFILE_MODE", "")
+STATIC_ACCEL_PREFIX = os.getenv("STATIC_ACCEL_PREFIX", "/_uploads")
+# Старые загрузки в uploads/ и uploads/userbanner лежат под исходными именами,
+# их могут удалить или заменить руками. Объекты (uploads/objects) и варианты
+# названы по хешу содержимого и отдаются как immutable с IMMUTABLE_MAX_AGE
+UPLOADS_MAX_AGE = int(os.getenv("UPLOADS_MAX_AGE", 86400))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def send_static(folder, filename, immutable=False):
+    max_age = IMMUTABLE_MAX_AGE if immutable else UPLOADS_MAX_AGE
+
+    if STATIC_SENDFILE_MODE == "x-accel":
+        path = safe_join(os.path.join(current_app.root_path, folder), filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        # "uploads/userbanner" -> "/_uploads/userbanner/<filename>"
+        relative = os.path.relpath(path, os.path.join(current_app.root_path, "uploads"))
+        response = make_response("")
+        response.headers["X-Accel-Redirect"] = f"{STATIC_ACCEL_PREFIX}/{relative}"
+        response.mimetype = (
+            mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        )
+    else:
+        # В режиме x-sendfile тело подставит веб-сервер (USE_X_SENDFILE)
+        response = send_from_directory(folder, filename, max_age=max_age)
+
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if immutable:
+        response.cache_control.immutable = True
+    return response
@@ -0,0 +1,299 @@
+"""Контентно-адресуемое хранилище загрузок.
+
+Файл лежит в uploads/objects/<ab>/<cd>/<sha256>.<ext>, в MySQL ведется
+счетчик ссылок (upload_blobs) и журнал загрузок (uploads). Тело запроса
+читается потоком во временный файл; если такие байты уже есть, временный
+файл удаляется и новый объект не создается.
+
+ref_count — сколько раз на объект ссылаются посты (URL в HTML) и баннеры
+пользователей. Сама загрузка ссылку не берет: ее берет запись, которая
+сохраняет URL, в той же транзакции (update_refs). Только что загруженный
+объект без ссылок сборщик не трогает UPLOAD_GC_GRACE секунд.
+
+Удаление файлов без ссылок (вместе с их вариантами из uploads/variants):
+
+    python storage.py gc
+"""
+
+import glob
+import hashlib
+import os
+import re
+import sys
+import tempfile
+from collections import Counter
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import (
+    Data,
+    Epilogue,
+    Field,
+    File,
+    MultipartDecoder,
+    NeedData,
+)
+from config import get_db_connection
+from images import VARIANTS_FOLDER, load_manifest, manifest_path, variant_files
+
+OBJECTS_FOLDER = "uploads/objects"
+CHUNK_SIZE = 64 * 1024
+# Сколько секунд загруженный объект ждет, пока на него сошлется пост или баннер
+UPLOAD_GC_GRACE = int(os.getenv("UPLOAD_GC_GRACE", 86400))
+
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"\xff\xd8\xff", "jpg", "image/jpeg"),
+    (b"GIF87a", "gif", "image/gif"),
+    (b"GIF89a", "gif", "image/gif"),
+)
+
+OBJECT_URL_RE = re.compile(r"/uploads/objects/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.")
+
+os.makedirs(OBJECTS_FOLDER, exist_ok=True)
+
+
+def sniff_image_type(head):
+    for signature, ext, mimetype in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return ext, mimetype
+    return None
+
+
+def object_name(digest, ext):
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def object_path(digest, ext):
+    return os.path.join(OBJECTS_FOLDER, object_name(digest, ext))
+
+
+def object_url(digest, ext):
+    return f"{os.getenv('API_URL')}/uploads/objects/{object_name(digest, ext)}"
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def receive_upload(stream, content_type, max_size, field="file", allowed_name=None):
+    # Разбираем multipart сами, по кускам: файл сразу пишется во временный
+    # файл и хешируется, тип проверяется по первым байтам, и при ошибке
+    # остаток тела запроса не читается
+    mimetype, options = parse_options_header(content_type or "")
+    if mimetype != "multipart/form-data" or "boundary" not in options:
+        raise UploadError("Некорректный запрос")
+
+    decoder = MultipartDecoder(options["boundary"].encode("latin-1"), max_size)
+    tmp_dir = os.path.join(OBJECTS_FOLDER, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    received = None
+    tmp = None
+    current = None
+    head = b""
+    ended = False
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        while True:
+            event = decoder.next_event()
+
+            if isinstance(event, NeedData):
+                if ended:
+                    raise UploadError("Некорректный запрос")
+                chunk = stream.read(CHUNK_SIZE)
+                ended = not chunk
+                decoder.receive_data(chunk or None)
+                continue
+
+            if isinstance(event, Epilogue):
+                break
+
+            if isinstance(event, File) and event.name == field and received is None:
+                if allowed_name is not None and not allowed_name(event.filename or ""):
+                    raise UploadError("Неправильный формат файла")
+                current = field
+                received = {"filename": event.filename or "", "kind": None}
+                continue
+
+            if isinstance(event, (File, Field)):
+                current = None
+                continue
+
+            if isinstance(event, Data) and current == field:
+                data = event.data
+                size += len(data)
+                if size > max_size:
+                    raise UploadError("Файл слишком большой", 413)
+
+                if received["kind"] is None:
+                    head += data
+                    if len(head) < 16 and event.more_data:
+                        continue
+                    received["kind"] = sniff_image_type(head)
+                    if received["kind"] is None:
+                        raise UploadError("Неправильный формат файла")
+                    tmp = tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False)
+                    data, head = head, b""
+
+                digest.update(data)
+                tmp.write(data)
+
+                if not event.more_data:
+                    current = None
+
+        if received is None or received["kind"] is None:
+            raise UploadError("Файл не передан")
+
+        # fsync откладывается до store_upload: для дубликата он не нужен
+        tmp.close()
+    except ValueError:
+        # Битый multipart
+        if tmp is not None:
+            tmp.close()
+            os.remove(tmp.name)
+        raise UploadError("Некорректный запрос")
+    except Exception:
+        if tmp is not None:
+            tmp.close()
+            os.remove(tmp.name)
+        raise
+
+    received.update(
+        {"sha256": digest.hexdigest(), "size": size, "tmp_path": tmp.name}
+    )
+    return received
+
+
+def store_upload(received, kind, user_id=None):
+    ext, mimetype = received["kind"]
+    digest = received["sha256"]
+    path = object_path(digest, ext)
+
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                # last_used_at откладывает сборку мусора, пока ссылку не взяли
+                cursor.execute(
+                    """INSERT INTO upload_blobs (sha256, ext, size, mimetype, ref_count)
+                       VALUES (%s, %s, %s, %s, 0)
+                       ON DUPLICATE KEY UPDATE last_used_at = NOW()""",
+                    (digest, ext, received["size"], mimetype),
+                )
+                # 1 — строка новая, 2 или 0 — объект уже есть. Файл кладется под
+                # блокировкой строки: сборщик удаляет строку и файл в одной
+                # транзакции, так что файл существующей строки на месте
+                created = cursor.rowcount == 1
+                if created:
+                    with open(received["tmp_path"], "rb") as f:
+                        os.fsync(f.fileno())
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(received["tmp_path"], path)
+                cursor.execute(
+                    """INSERT INTO uploads (sha256, user_id, kind, original_name)
+                       VALUES (%s, %s, %s, %s)""",
+                    (digest, user_id, kind, received["filename"][:255]),
+                )
+                conn.commit()
+    finally:
+        # Такие байты уже есть — временный файл просто удаляется
+        if os.path.exists(received["tmp_path"]):
+            os.remove(received["tmp_path"])
+
+    return {
+        "sha256": digest,
+        "path": path,
+        "url": object_url(digest, ext),
+        "created": created,
+    }
+
+
+def referenced_objects(text):
+    # sha256 объектов, на которые ссылается текст (HTML поста, URL баннера), с повторами
+    return Counter(match.group(1) for match in OBJECT_URL_RE.finditer(text or ""))
+
+
+def update_refs(cursor, old_text, new_text):
+    # Переводит счетчики ссылок со старого текста на новый в транзакции
+    # вызывающего: +1 за каждую добавленную ссылку, -1 за убранную.
+    # Вставка — old_text=None, удаление — new_text=None. Один UPDATE на все объекты
+    old, new = referenced_objects(old_text), referenced_objects(new_text)
+    # Порядок по sha256 — одинаковый порядок блокировок во всех транзакциях
+    deltas = [(digest, new[digest] - old[digest]) for digest in sorted(old.keys() | new.keys())]
+    deltas = [(digest, delta) for digest, delta in deltas if delta]
+    if not deltas:
+        return
+    cases = " ".join(["WHEN %s THEN %s"] * len(deltas))
+    placeholders = ", ".join(["%s"] * len(deltas))
+    cursor.execute(
+        f"""UPDATE upload_blobs
+            SET ref_count = GREATEST(0, CAST(ref_count AS SIGNED) + CASE sha256 {cases} END),
+                last_used_at = NOW()
+            WHERE sha256 IN ({placeholders})""",
+        [value for delta in deltas for value in delta] + [digest for digest, _ in deltas],
+    )
+
+
+def remove_unreferenced_variants(candidates):
+    # Варианты названы по хешу содержимого, и одинаковые по байтам варианты
+    # разных оригиналов (например, отличавшихся только EXIF) лежат в одном
+    # файле. Удаляем только те, на которые не ссылается ни один манифест
+    uploads_root = os.path.dirname(OBJECTS_FOLDER)
+    for path in glob.iglob(os.path.join(uploads_root, "**", "*.variants.json"), recursive=True):
+        if not candidates:
+            return 0
+        manifest = load_manifest(path[: -len(".variants.json")])
+        if manifest:
+            candidates -= variant_files(manifest)
+
+    removed = 0
+    for filename in candidates:
+        path = os.path.join(VARIANTS_FOLDER, filename)
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def collect_garbage():
+    removed = 0
+    variants = set()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                """SELECT sha256, ext FROM upload_blobs
+                   WHERE ref_count = 0 AND last_used_at < NOW() - INTERVAL %s SECOND""",
+                (UPLOAD_GC_GRACE,),
+            )
+            for blob in cursor.fetchall():
+                # Удаляем строку только если ссылок так и не появилось. Файл
+                # удаляется до COMMIT, под блокировкой строки: параллельная
+                # загрузка тех же байтов ждет ее и создаст объект заново
+                cursor.execute(
+                    """DELETE FROM upload_blobs
+                       WHERE sha256 = %s AND ref_count = 0
+                       AND last_used_at < NOW() - INTERVAL %s SECOND""",
+                    (blob["sha256"], UPLOAD_GC_GRACE),
+                )
+                if cursor.rowcount:
+                    path = object_path(blob["sha256"], blob["ext"])
+                    manifest = load_manifest(path)
+                    if manifest:
+                        variants |= variant_files(manifest)
+                    for leftover in (path, manifest_path(path)):
+                        if os.path.exists(leftover):
+                            os.remove(leftover)
+                    removed += 1
+                conn.commit()
+    remove_unreferenced_variants(variants)
+    return removed
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["gc"]:
+        print(f"Удалено объектов: {collect_garbage()}")
+    else:
+        print(__doc__)
@@ -0,0 +1,153 @@
+"""Общие фикстуры: приложение на поддельной базе.
+
+Поддельное соединение подставляется вместо pymysql.connect, поэтому запросы
+проходят через настоящий пул, InstrumentedCursor и record_query — так же,
+как в проде, только без MySQL.
+"""
+
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+# Настройки до импорта app: кэш выключен, чтобы запросы доходили до базы
+os.environ.setdefault("DB_PORT", "3306")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ["CACHE_TYPE"] = "NullCache"
+os.environ["RATE_LIMIT_ENABLED"] = "0"
+os.environ["QUERY_BUDGET"] = "strict"
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import jwt
+import pymysql
+import pytest
+from flask import has_request_context
+from app import application
+from cache_store import post_cache, profile_cache
+from config import SECRET_KEY, db_pool
+from counters import comment_counts
+from db_metrics import query_listeners
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.connection = None
+        self.rowcount = -1
+        self.lastrowid = None
+        self._rows = []
+
+    def execute(self, query, args=None):
+        self.db.statements.append(query)
+        self.db.executed.append((query, args))
+        rows, self.rowcount, self.lastrowid = self.db.answer(query, args)
+        self._rows = [dict(row) for row in rows]
+        return self.rowcount
+
+    def executemany(self, query, args):
+        for row in args:
+            self.execute(query, row)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+        self.open = True
+        self.server_status = 0
+
+    def cursor(self, *args, **kwargs):
+        cursor = FakeCursor(self.db)
+        cursor.connection = self
+        return cursor
+
+    def ping(self, reconnect=False):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.open = False
+
+
+class FakeDatabase:
+    # Ответы задаются по регулярному выражению над текстом запроса:
+    # db.on(r"FROM users", [{"id": 1}]); rows и lastrowid могут быть функциями от параметров.
+    # Запись без правила меняет одну строку
+    def __init__(self):
+        self.rules = []
+        self.statements = []
+        self.executed = []
+
+    def on(self, pattern, rows=(), rowcount=None, lastrowid=None):
+        self.rules.insert(0, (re.compile(pattern, re.IGNORECASE | re.DOTALL), rows, rowcount, lastrowid))
+
+    def answer(self, query, args=None):
+        for pattern, rows, rowcount, lastrowid in self.rules:
+            if pattern.search(query):
+                if callable(rows):
+                    rows = rows(args)
+                if callable(lastrowid):
+                    lastrowid = lastrowid(args)
+                return rows, len(rows) if rowcount is None else rowcount, lastrowid
+        if re.match(r"\s*(INSERT|UPDATE|DELETE)", query, re.IGNORECASE):
+            return [], 1, 1
+        return [], 0, None
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake = FakeDatabase()
+    db_pool.close_all()
+    monkeypatch.setattr(pymysql, "connect", lambda **kwargs: FakeConnection(fake))
+    # Кэши внутри воркера пережили бы тест и спрятали запросы следующего
+    profile_cache._data.clear()
+    post_cache._data.clear()
+    yield fake
+    # Отложенный пересчет comment_count — пока база еще поддельная
+    comment_counts.flush()
+    db_pool.close_all()
+
+
+@pytest.fixture
+def client(db):
+    application.config["TESTING"] = True
+    return application.test_client()
+
+
+@pytest.fixture
+def round_trips():
+    # Обращения к БД внутри HTTP-запросов, по одному списку на тест
+    seen = []
+
+    def listener(sql, params, seconds):
+        if has_request_context():
+            seen.append(sql)
+
+    query_listeners.append(listener)
+    yield seen
+    query_listeners.remove(listener)
+
+
+def make_token(user_id):
+    now = int(time.time())
+    return jwt.encode({"sub": str(user_id), "iat": now, "exp": now + 600}, SECRET_KEY, algorithm="HS256")
+
+
+def auth(user_id):
+    return {"Authorization": f"Bearer {make_token(user_id)}"}
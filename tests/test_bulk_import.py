@@ -0,0 +1,30 @@
+import json
+from app import application
+from conftest import auth
+
+# Строки из пробелов импорт пропускает, но они считаются в размер тела
+PADDING = "\n".join([" " * 1023] * 6 * 1024)
+
+
+def ndjson(*records):
+    return "\n".join(json.dumps(r) for r in records).encode()
+
+
+def test_import_accepts_body_over_request_limit(db, client):
+    body = ndjson({"type": "post", "id": 1, "title": "t", "content": "x", "author_id": 1})
+    body += f"\n{PADDING}\n".encode()
+    assert len(body) > application.config["MAX_CONTENT_LENGTH"]
+
+    response = client.post("/import", data=body, headers=auth(1))
+
+    assert response.status_code == 200
+    assert response.get_json()["posts"] == 1
+
+
+def test_import_over_its_own_limit_is_413(db, client, monkeypatch):
+    monkeypatch.setitem(application.config, "IMPORT_MAX_CONTENT_LENGTH", 1024)
+    body = ndjson({"type": "post", "id": 1, "title": "t", "content": "x" * 4096, "author_id": 1})
+
+    response = client.post("/import", data=body, headers=auth(1))
+
+    assert response.status_code == 413
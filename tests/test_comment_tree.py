@@ -0,0 +1,24 @@
+from routes.comments import build_comment_tree
+
+
+def row(comment_id, parent_id, level, sibling_count):
+    return {"id": comment_id, "parent_id": parent_id, "level": level, "sibling_count": sibling_count}
+
+
+def test_counts_replies_cut_by_sql():
+    # Так отвечает SQL при depth=2, replies=2: у корня 5 ответов, отданы два;
+    # у ответа 2 есть ответ на третьем уровне, он нужен только для счетчика
+    rows = [
+        row(1, None, 1, 0),
+        row(2, 1, 2, 5),
+        row(3, 1, 2, 5),
+        row(4, 2, 3, 1),
+    ]
+
+    [root] = build_comment_tree(rows, [1], depth=2)
+
+    assert [reply["id"] for reply in root["replies"]] == [2, 3]
+    assert root["reply_count"] == 5 and root["has_more_replies"]
+    first, second = root["replies"]
+    assert first["replies"] == [] and first["reply_count"] == 1 and first["has_more_replies"]
+    assert second["reply_count"] == 0 and not second["has_more_replies"]
@@ -0,0 +1,16 @@
+import counters
+
+
+def test_reconcile_invalidates_fixed_posts(db, monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(counters, "invalidate", lambda *tags: invalidated.extend(tags))
+    db.on(r"SELECT MAX\(id\)", lambda args: [{"max_id": 10}] if args[0] == 0 else [{"max_id": None}])
+    db.on(r"SELECT p\.id FROM posts p", [{"id": 3}, {"id": 7}])
+    db.on(r"UPDATE posts p", rowcount=2)
+
+    assert counters.reconcile(batch_size=10) == 2
+
+    assert "posts" in invalidated
+    assert {"post:3", "post:7"} <= set(invalidated)
+    update = next(args for query, args in db.executed if query.lstrip().startswith("UPDATE"))
+    assert list(update) == [3, 7]
@@ -0,0 +1,31 @@
+import pytest
+import jobs
+
+
+@pytest.fixture
+def queue(monkeypatch, tmp_path):
+    monkeypatch.setattr(jobs, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(jobs, "_local", jobs.threading.local())
+    monkeypatch.setitem(jobs.HANDLERS, "echo", lambda value: value)
+    return jobs
+
+
+def test_run_job_marks_done(queue):
+    job = queue.claim(worker_id="a", job_id=queue.enqueue("echo", {"value": 1}))
+
+    assert queue.run_job(job) is True
+    assert queue.get_job(job["id"])["status"] == "done"
+
+
+def test_run_job_does_not_overwrite_reclaimed_job(queue, monkeypatch):
+    job_id = queue.enqueue("echo", {"value": 1})
+    stale = queue.claim(worker_id="a", job_id=job_id)
+    # Блокировка истекла, задачу забрал другой воркер
+    monkeypatch.setattr(queue, "JOBS_LOCK_TIMEOUT", -1)
+    fresh = queue.claim(worker_id="b")
+    assert fresh["id"] == job_id
+
+    assert queue.run_job(stale) is False
+    assert queue.get_job(job_id)["status"] == "running"
+    assert queue.run_job(fresh) is True
+    assert queue.get_job(job_id)["status"] == "done"
@@ -0,0 +1,221 @@
+import io
+from datetime import datetime
+import pytest
+from flask import Flask
+import app as app_module
+import routes.auth
+import storage
+from app import application
+from config import get_db_connection
+from conftest import auth
+from query_budget import QueryBudgetError, init_query_budget, query_budget
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+OLD_BANNER = "http://test/uploads/objects/aa/bb/" + "a" * 64 + ".png"
+CREATED = datetime(2024, 5, 1, 12, 0)
+
+USER = {
+    "id": 5,
+    "nickname": "tester",
+    "email": "tester@example.com",
+    "bio": "",
+    "banner_url": None,
+    "status": "",
+    "created_at": "01.05.2024",
+    "is_active": 1,
+}
+POST = {
+    "id": 7,
+    "title": "Заголовок поста",
+    "content": "Текст поста",
+    "created_at": "01.05.2024, 12:00",
+    "updated_at": None,
+    "author_id": 5,
+    "comment_count": 1,
+    "author_nickname": "tester",
+}
+COMMENT = {
+    "id": 3,
+    "post_id": 7,
+    "user_id": 5,
+    "nickname": "tester",
+    "content": "Текст комментария",
+    "parent_id": None,
+    "created_at": "01.05.2024 в 12:00",
+}
+LONG_TEXT = "Достаточно длинный текст поста, чтобы пройти проверку длины содержимого."
+
+
+def no_setup(db, monkeypatch, tmp_path):
+    pass
+
+
+def setup_upload(db, monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "OBJECTS_FOLDER", str(tmp_path))
+    monkeypatch.setattr(app_module, "enqueue_variants", lambda path: {"id": 1})
+    db.on(r"SELECT banner_url", [{"banner_url": OLD_BANNER}])
+
+
+def setup_post_images(db, monkeypatch, tmp_path):
+    # Из поста убрали картинку — ее счетчик ссылок уменьшается
+    db.on(r"SELECT content FROM posts", [{"content": f'<p>{LONG_TEXT}</p><img src="{OLD_BANNER}">'}])
+
+
+def setup_login(db, monkeypatch, tmp_path):
+    # Самый дорогой путь входа — с перехешированием пароля
+    db.on(r"FROM users WHERE email", [{"id": 5, "email": USER["email"], "password_hash": "$2b$04$x"}])
+    monkeypatch.setattr(routes.auth, "check_password", lambda password, password_hash: True)
+    monkeypatch.setattr(routes.auth, "needs_rehash", lambda password_hash: True)
+    monkeypatch.setattr(routes.auth, "hash_password", lambda password: "$2b$12$x")
+
+
+def setup_register(db, monkeypatch, tmp_path):
+    monkeypatch.setattr(routes.auth, "hash_password", lambda password: "$2b$12$x")
+
+
+def setup_reads(db, monkeypatch, tmp_path):
+    db.on(r"^\s*SELECT\b.*FROM users", [USER])
+    db.on(r"FROM posts p\s+WHERE p.id", [POST])
+    db.on(r"ORDER BY\s+p.sort_at", [{**POST, "sort_at": CREATED}])
+    db.on(r"JOIN posts p ON p.id = m.id", [{**POST, "score": 1.5}])
+    db.on(r"FROM comments c\s+WHERE c.post_id", [COMMENT])
+    db.on(r"parent_id IS NULL", [{"id": 3, "created_at": CREATED}])
+    db.on(r"WITH RECURSIVE", [{**COMMENT, "level": 1, "sibling_count": 0}])
+    db.on(r"SELECT post_id FROM comments", [{"post_id": 7}])
+
+
+def upload_file():
+    return {"data": {"file": (io.BytesIO(PNG), "image.png")}, "content_type": "multipart/form-data"}
+
+
+# Для каждого маршрута — самый дорогой из штатных путей
+ROUTES = [
+    ("upload_file", "POST", "/upload", setup_upload, upload_file, 200),
+    (
+        "upload_banner",
+        "POST",
+        "/upload/userbanner/5",
+        setup_upload,
+        lambda: {**upload_file(), "headers": auth(5)},
+        200,
+    ),
+    (
+        "userLogin",
+        "POST",
+        "/login",
+        setup_login,
+        lambda: {"json": {"email": USER["email"], "password": "secret"}},
+        200,
+    ),
+    (
+        "userRegistration",
+        "POST",
+        "/register",
+        setup_register,
+        lambda: {"json": {"email": "new@example.com", "password": "secret", "nickname": "new"}},
+        201,
+    ),
+    ("getUser", "GET", "/profile/5", setup_reads, dict, 200),
+    (
+        "updateUserInfo",
+        "PATCH",
+        "/profile/5",
+        no_setup,
+        lambda: {"headers": auth(5), "json": {"nickname": "renamed", "bio": "bio"}},
+        201,
+    ),
+    ("get_all_post", "GET", "/posts", setup_reads, dict, 200),
+    ("get_single_post", "GET", "/posts/7", setup_reads, dict, 200),
+    (
+        "create_new_post",
+        "POST",
+        "/posts/create",
+        setup_reads,
+        lambda: {
+            "headers": auth(5),
+            "json": {"author_id": 5, "title": "Новый заголовок", "content": f'{LONG_TEXT}<img src="{OLD_BANNER}">'},
+        },
+        201,
+    ),
+    (
+        "post_detail",
+        "PATCH",
+        "/posts/7",
+        setup_post_images,
+        lambda: {"headers": auth(5), "json": {"title": "Новый заголовок", "content": LONG_TEXT}},
+        200,
+    ),
+    ("post_detail", "DELETE", "/posts/7", setup_post_images, lambda: {"headers": auth(5)}, 200),
+    (
+        "toggle_post_option",
+        "PATCH",
+        "/posts/option/7",
+        no_setup,
+        lambda: {"headers": auth(1), "json": {"option": "is_pinned"}},
+        200,
+    ),
+    ("searchPosts", "GET", "/search?q=python", setup_reads, dict, 200),
+    ("getPostComments", "GET", "/posts/7/comments", setup_reads, dict, 200),
+    ("getPostCommentTree", "GET", "/posts/7/comments/tree", setup_reads, dict, 200),
+    (
+        "addCommentToPost",
+        "POST",
+        "/posts/7/comments",
+        setup_reads,
+        lambda: {"headers": auth(5), "json": {"post_id": 7, "user_id": 5, "content": "Текст комментария"}},
+        200,
+    ),
+    ("delPostComment", "DELETE", "/comments/3", setup_reads, lambda: {"headers": auth(5)}, 200),
+]
+
+
+def test_every_budgeted_route_is_covered():
+    budgeted = {
+        endpoint
+        for endpoint, view in application.view_functions.items()
+        if getattr(view, "query_budget", None) is not None
+    }
+    assert budgeted == {route[0] for route in ROUTES}
+
+
+@pytest.mark.parametrize(
+    "endpoint, method, path, setup, request_kwargs, status",
+    ROUTES,
+    ids=[f"{route[0]}-{route[1]}" for route in ROUTES],
+)
+def test_route_fits_budget(
+    client, db, round_trips, monkeypatch, tmp_path, endpoint, method, path, setup, request_kwargs, status
+):
+    setup(db, monkeypatch, tmp_path)
+
+    response = client.open(path, method=method, **request_kwargs())
+
+    assert response.status_code == status, response.get_data(as_text=True)
+    # Бюджет точный: лишний запрос уронит тест, а запас не копится незаметно
+    assert len(round_trips) == application.view_functions[endpoint].query_budget, round_trips
+
+
+def test_over_budget_raises(client, db, monkeypatch):
+    setup_reads(db, monkeypatch, None)
+    monkeypatch.setattr(application.view_functions["getPostComments"], "query_budget", 1)
+
+    with pytest.raises(QueryBudgetError, match="2 обращений к БД при бюджете 1"):
+        client.get("/posts/7/comments")
+
+
+def test_repeated_statement_reported_as_n_plus_one(db):
+    n_plus_one = Flask(__name__)
+    n_plus_one.testing = True
+    init_query_budget(n_plus_one)
+
+    @n_plus_one.route("/posts")
+    @query_budget(10)
+    def posts_with_authors():
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                for author_id in (1, 2, 3):
+                    cursor.execute("SELECT nickname FROM users WHERE id = %s", (author_id,))
+        return "ok"
+
+    with pytest.raises(QueryBudgetError, match="возможный N\\+1, 3 раз: SELECT nickname FROM users WHERE id = \\?"):
+        n_plus_one.test_client().get("/posts")
@@ -0,0 +1,43 @@
+from flask import Flask
+import rate_limit
+from rate_limit import SQLiteStore, client_ip
+
+
+def test_rejected_request_does_not_charge_other_limits(tmp_path):
+    store = SQLiteStore(str(tmp_path / "limits.sqlite3"))
+    ip = ("login:ip:1.2.3.4", 1.0, 1.0)
+    email = ("login:email:a@example.com", 10.0, 0.0)
+
+    assert store.hit([ip, email], 100.0) is None
+    # email исчерпан: запрос отклонен, и лимит IP не тратится
+    assert store.hit([ip, email], 100.0) == 10.0
+    assert store.hit([ip], 100.0) is None
+    assert store.hit([ip], 100.0) == 1.0
+
+
+def test_client_ip_ignores_addresses_sent_by_client(monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_IP_HEADER", "X-Forwarded-For")
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_TRUSTED_HOPS", 1)
+    app = Flask(__name__)
+
+    with app.test_request_context(headers={"X-Forwarded-For": "6.6.6.6, 1.2.3.4"}):
+        assert client_ip() == "1.2.3.4"
+
+    with app.test_request_context(headers={"X-Forwarded-For": ""}, environ_base={"REMOTE_ADDR": "10.0.0.1"}):
+        assert client_ip() == "10.0.0.1"
+
+
+def test_login_email_limit_is_per_client_ip(monkeypatch, tmp_path):
+    monkeypatch.setattr(rate_limit, "_store", SQLiteStore(str(tmp_path / "limits.sqlite3")))
+    app = Flask(__name__)
+    body = {"email": "victim@example.com", "password": "wrong"}
+
+    def attempt(ip):
+        with app.test_request_context(json=body, environ_base={"REMOTE_ADDR": ip}):
+            return rate_limit.check("login")
+
+    for _ in range(5):
+        assert attempt("6.6.6.6") is None
+    assert attempt("6.6.6.6") is not None
+    # Чужие попытки не блокируют вход владельцу с его адреса
+    assert attempt("1.2.3.4") is None
@@ -0,0 +1,40 @@
+import json
+import storage
+from storage import collect_garbage, object_path, referenced_objects
+
+GONE = "a" * 64
+KEPT = "b" * 64
+
+
+def write_object(digest, variants):
+    path = object_path(digest, "png")
+    storage.os.makedirs(storage.os.path.dirname(path), exist_ok=True)
+    open(path, "wb").close()
+    manifest = {"variants": {name: {"webp": {"file": name}} for name in variants}}
+    with open(f"{path}.variants.json", "w") as f:
+        json.dump(manifest, f)
+    return path
+
+
+def test_gc_removes_variants_no_manifest_references(db, monkeypatch, tmp_path):
+    variants = tmp_path / "variants"
+    variants.mkdir()
+    monkeypatch.setattr(storage, "OBJECTS_FOLDER", str(tmp_path / "objects"))
+    monkeypatch.setattr(storage, "VARIANTS_FOLDER", str(variants))
+    gone = write_object(GONE, ["only-gone.webp", "shared.webp"])
+    write_object(KEPT, ["shared.webp"])
+    for name in ("only-gone.webp", "shared.webp"):
+        (variants / name).touch()
+    db.on(r"SELECT sha256, ext FROM upload_blobs", [{"sha256": GONE, "ext": "png"}])
+
+    assert collect_garbage() == 1
+
+    assert not storage.os.path.exists(gone)
+    assert not (variants / "only-gone.webp").exists()
+    # Тот же файл варианта нужен оставшемуся объекту
+    assert (variants / "shared.webp").exists()
+
+
+def test_referenced_objects_counts_repeats():
+    url = f"http://test/uploads/objects/aa/aa/{GONE}.png"
+    assert referenced_objects(f'<img src="{url}"><img src="{url}?variant=thumb">') == {GONE: 2}
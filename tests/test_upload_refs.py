@@ -0,0 +1,85 @@
+from collections import Counter
+from itertools import count
+import pytest
+from conftest import auth
+
+IMAGE = "http://test/uploads/objects/cc/cc/" + "c" * 64 + ".png"
+TEXT = "Достаточно длинный текст поста, чтобы пройти проверку длины содержимого."
+
+
+@pytest.fixture
+def blog(db):
+    # Посты и счетчики ссылок живут в словарях: поддельная база отвечает
+    # на SELECT content тем, что записали INSERT/UPDATE маршрутов
+    posts = {}
+    refs = Counter()
+
+    def content(args):
+        post_id = int(args[0])
+        return [{"content": posts[post_id]}] if post_id in posts else []
+
+    ids = count(1)
+    db.on(r"SELECT content FROM posts", content)
+    db.on(r"INSERT INTO posts", rowcount=1, lastrowid=lambda args: next(ids))
+    db.on(r"^\s*SELECT\b.*FROM users", [{"id": 5, "nickname": "tester"}])
+
+    def apply_writes():
+        for query, args in db.executed:
+            if query.lstrip().startswith("UPDATE upload_blobs"):
+                for i in range(len(args) // 3):
+                    refs[args[2 * i]] += args[2 * i + 1]
+                    refs[args[2 * i]] = max(0, refs[args[2 * i]])
+            elif query.lstrip().startswith("UPDATE posts"):
+                posts[int(args[-1])] = args[1]
+            elif query.lstrip().startswith("DELETE FROM posts"):
+                posts.pop(int(args[0]))
+        db.executed.clear()
+
+    class Blog:
+        def create(self, client, text):
+            body = {"author_id": 5, "title": "Заголовок поста", "content": text}
+            response = client.post("/posts/create", headers=auth(5), json=body)
+            assert response.status_code == 201
+            post_id = response.get_json()["post"]["id"]
+            posts[post_id] = text
+            apply_writes()
+            return post_id
+
+        def edit(self, client, post_id, text):
+            body = {"title": "Заголовок поста", "content": text}
+            assert client.patch(f"/posts/{post_id}", headers=auth(5), json=body).status_code == 200
+            apply_writes()
+
+        def delete(self, client, post_id):
+            assert client.delete(f"/posts/{post_id}", headers=auth(5)).status_code == 200
+            apply_writes()
+
+        def refs(self):
+            return refs["c" * 64]
+
+    return Blog()
+
+
+def with_image(text):
+    return f'{text}<img src="{IMAGE}">'
+
+
+def test_image_removed_and_added_back_keeps_reference(client, blog):
+    post_id = blog.create(client, with_image(TEXT))
+    blog.edit(client, post_id, TEXT)
+    assert blog.refs() == 0
+
+    blog.edit(client, post_id, with_image(TEXT))
+
+    assert blog.refs() == 1
+
+
+def test_deleting_one_of_two_posts_sharing_an_image_keeps_reference(client, blog):
+    first = blog.create(client, with_image(TEXT))
+    second = blog.create(client, with_image(TEXT))
+
+    blog.delete(client, second)
+
+    assert blog.refs() == 1
+    blog.delete(client, first)
+    assert blog.refs() == 0
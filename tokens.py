@@ -0,0 +1,46 @@
+import hashlib
+import os
+import time
+import jwt
+from config import SECRET_KEY
+from cache_store import LRUCache
+
+token_cache = LRUCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", 4096)),
+    ttl=int(os.getenv("TOKEN_CACHE_TTL", 3600)),
+)
+
+# Функции вида check(claims) -> bool, True — токен отозван
+revocation_checks = []
+
+
+def register_revocation_check(check):
+    revocation_checks.append(check)
+    return check
+
+
+def _is_revoked(claims):
+    return any(check(claims) for check in revocation_checks)
+
+
+def decode_token(token):
+    # Полная проверка подписи выполняется один раз на токен в воркере,
+    # дальше берем claims из кэша, но exp и отзыв проверяем каждый раз
+    if token.startswith("Bearer "):
+        token = token[7:]
+
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    claims = token_cache.get(key, None)
+
+    if claims is None:
+        claims = jwt.decode(
+            token, SECRET_KEY, algorithms=["HS256"], options={"require_exp": True}
+        )
+        token_cache.set(key, None, claims)
+    elif claims["exp"] <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+
+    if _is_revoked(claims):
+        raise jwt.InvalidTokenError("Токен отозван")
+
+    return claims